@@ -6,30 +6,169 @@ Identifies and tracks agent instances across multiple API requests by analyzing
 conversation history patterns and fingerprinting conversation states.
 """
 
+import array
+import functools
 import hashlib
-from typing import Dict, List, Any, Optional, Set
+import itertools
+import json
+import re
+import string
+import sys
+from typing import Dict, Iterable, Iterator, List, Any, Optional, Set
 from dataclasses import dataclass, field
-from collections import defaultdict
+from datetime import datetime
 
+try:
+    import orjson
+except ImportError:  # optional speedup, falls back to stdlib json
+    orjson = None
 
-def compute_hash(text: str, length: int = 16) -> str:
-    """Compute a short hash of text."""
-    return hashlib.sha256(text.encode()).hexdigest()[:length]
 
+# normalize_command works on ASCII bytes: non-ASCII characters are dropped by the
+# encode, every other non-alphanumeric byte is deleted and letters are lowercased
+# by a single bytes.translate call
+_ALNUM_BYTES = (string.ascii_letters + string.digits).encode()
+_NORMALIZE_TABLE = bytes.maketrans(string.ascii_uppercase.encode(), string.ascii_lowercase.encode())
+_NORMALIZE_DELETE = bytes(b for b in range(256) if b not in _ALNUM_BYTES)
+# normalize_commands_batch keeps NUL as the separator between joined commands
+_NORMALIZE_BATCH_DELETE = _NORMALIZE_DELETE.replace(b'\x00', b'')
 
-@dataclass
+# Patterns used on the per-message command extraction path
+_RE_COMMAND = re.compile(r'Command:\s*')
+_RE_HEREDOC = re.compile(r"<<['\"]?([A-Za-z_][A-Za-z0-9_]*)['\"]?")
+_RE_FIRST_LINE = re.compile(r'^(.+?)(?:\n|$)')
+_RE_NON_WHITESPACE = re.compile(r'\S+')
+
+
+@functools.lru_cache(maxsize=256)
+def _heredoc_close_pattern(marker: str) -> re.Pattern:
+    """Compile the closing-marker pattern for a heredoc (on its own line, possibly with trailing )")."""
+    return re.compile(rf'\n{re.escape(marker)}(?:\s*\)?"?\)?)?\s*(?:\n|$)')
+
+
+# Fingerprints only key in-memory dicts, so a fast non-cryptographic digest is
+# enough. Set to True to reproduce SHA-256 prefixes from older exports (call
+# clear_hash_cache() after flipping it at runtime).
+COMPAT_SHA256 = False
+
+
+def compute_hash_bytes(data: bytes, length: int = 16) -> str:
+    """Compute a short hash of already-encoded data (same digest as compute_hash)."""
+    if COMPAT_SHA256:
+        return hashlib.sha256(data).hexdigest()[:length]
+    return hashlib.blake2b(data, digest_size=length // 2).hexdigest()
+
+
+def _compute_hash_raw(text: str, length: int = 16) -> str:
+    """Compute a short hash of text (BLAKE2b sized to `length` hex chars)."""
+    return compute_hash_bytes(text.encode(), length)
+
+
+# System prompts, tool inputs and tool results recur across many requests, so
+# repeated hashes are served from an LRU cache keyed by (text, length).
+compute_hash = functools.lru_cache(maxsize=65536)(_compute_hash_raw)
+
+
+def _collapse_whitespace_prefix(text: str, limit: int = 200) -> str:
+    """
+    Return ' '.join(text.split())[:limit] without splitting the whole text.
+
+    Long texts are tokenized lazily and the scan stops once `limit`
+    characters of collapsed output are available.
+    """
+    if len(text) <= 4 * limit:
+        return ' '.join(text.split())[:limit]
+
+    words = []
+    collapsed_len = -1
+    for match in _RE_NON_WHITESPACE.finditer(text):
+        word = match.group()
+        words.append(word)
+        collapsed_len += len(word) + 1
+        if collapsed_len >= limit:
+            break
+    return ' '.join(words)[:limit]
+
+
+@functools.lru_cache(maxsize=4096)
+def _normalize_and_hash(text: str) -> str:
+    """
+    Hash the whitespace-collapsed first 200 characters of a text block.
+
+    Used to match response text against later request content. Claude Code
+    replays the full history in every request, so the same text blocks are
+    normalized over and over; the LRU skips the split/join for repeats.
+    The hash is interned so every index entry and content_reuse edge for
+    the same content shares one string, even after LRU eviction.
+    """
+    return sys.intern(compute_hash(_collapse_whitespace_prefix(text, 200), length=16))
+
+
+def clear_hash_cache():
+    """Clear the memoized compute_hash results (mainly for tests)."""
+    compute_hash.cache_clear()
+    _normalize_and_hash.cache_clear()
+
+
+def _new_hasher(length: int = 16):
+    """Create the streaming hasher matching compute_hash for the given length."""
+    if COMPAT_SHA256:
+        return hashlib.sha256()
+    return hashlib.blake2b(digest_size=length // 2)
+
+
+def compute_joined_hash(parts: List[str], separator: str = '|||', length: int = 16) -> str:
+    """
+    Hash separator-joined strings without building the joined string.
+
+    Returns the same value as compute_hash(separator.join(parts), length).
+    """
+    h = _new_hasher(length)
+    sep = separator.encode()
+    for i, part in enumerate(parts):
+        if i:
+            h.update(sep)
+        h.update(part.encode())
+    return h.hexdigest()[:length]
+
+
+def _dumps_canonical(obj: Any) -> bytes:
+    """Serialize a JSON-compatible object to canonical (key-sorted) JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+    return json.dumps(obj, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode()
+
+
+def _hash_obj(obj: Any, length: int = 16) -> str:
+    """
+    Hash a tool input / tool result object via its canonical JSON bytes.
+
+    Avoids building a Python-level str() repr, and is insensitive to dict key order.
+    """
+    if COMPAT_SHA256:
+        return compute_hash(str(obj), length=length)
+    return compute_hash_bytes(_dumps_canonical(obj), length=length)
+
+
+@dataclass(slots=True)
 class AgentInstance:
-    """Represents a single agent instance across multiple API requests."""
+    """
+    Represents a single agent instance across multiple API requests.
+
+    Slotted, with request ids and message counts stored as native-int arrays,
+    since large logs hold thousands of instances with long request histories.
+    """
     agent_id: str
     system_prompt_hash: str
-    conversation_fingerprint: str
-    requests: List[int] = field(default_factory=list)
+    conversation_fingerprint: bytes  # raw digest; hex-encoded in to_dict
+    requests: array.array = field(default_factory=lambda: array.array('i'))
     first_request_id: int = None
     last_request_id: int = None
-    message_count_history: List[int] = field(default_factory=list)
+    message_count_history: array.array = field(default_factory=lambda: array.array('I'))
     spawned_by_task_id: Optional[str] = None
     parent_agent_id: Optional[str] = None
     first_user_message: str = ""
+    first_message_hash: Optional[str] = None  # compute_hash(first_user_message, 16), used for spawn matching
 
     # Workflow tracking - NEW
     child_agent_ids: List[str] = field(default_factory=list)  # Agents spawned by this agent
@@ -38,15 +177,20 @@ class AgentInstance:
     timestamps: List[str] = field(default_factory=list)  # Timestamp for each request
 
     def to_dict(self) -> Dict[str, Any]:
-        """Convert to dictionary for JSON serialization."""
+        """
+        Convert to dictionary for JSON serialization.
+
+        The derived counts are len() calls, which are O(1) on lists and arrays,
+        so they are not cached separately.
+        """
         return {
             'agent_id': self.agent_id,
             'system_prompt_hash': self.system_prompt_hash,
-            'conversation_fingerprint': self.conversation_fingerprint,
-            'requests': self.requests,
+            'conversation_fingerprint': self.conversation_fingerprint.hex(),
+            'requests': self.requests.tolist(),
             'first_request_id': self.first_request_id,
             'last_request_id': self.last_request_id,
-            'message_count_history': self.message_count_history,
+            'message_count_history': self.message_count_history.tolist(),
             'timestamps': self.timestamps,  # Include full timestamps list
             'spawned_by_task_id': self.spawned_by_task_id,
             'parent_agent_id': self.parent_agent_id,
@@ -61,6 +205,119 @@ class AgentInstance:
         }
 
 
+def _update_message_signature(h, msg: Dict, input_hash_cache: Optional[Dict[str, str]] = None):
+    """
+    Feed the content signature of a single message into a running hasher.
+
+    The bytes are "role:[text:<hash>,tool_use:<name>:<hash>,tool_result:<hash>]",
+    streamed piece by piece so no per-message signature string is built.
+    Uses role + block types + content hashes (NOT tool_use IDs), so the same
+    conversation state matches across replays and content format variations.
+
+    Args:
+        h: hashlib hasher to update
+        msg: Message dictionary
+        input_hash_cache: Optional tool_use_id -> input hash cache. A tool_use
+            block is replayed unchanged in every later request of the
+            conversation, so its input only needs serializing once.
+    """
+    update = h.update
+    content = msg.get('content', [])
+
+    # Normalize content to list of blocks
+    if isinstance(content, str):
+        # Convert string content to structured format
+        content = [{'type': 'text', 'text': content}]
+    elif not isinstance(content, list):
+        content = []
+
+    update(msg.get('role', '').encode())
+    update(b':[')
+    first = True
+    for block in content:
+        if isinstance(block, dict):
+            block_type = block.get('type', 'unknown')
+
+            if block_type == 'text':
+                # For text blocks, use truncated hash
+                text = block.get('text', '')
+                text_hash = compute_hash(text, length=8)
+                update(b'text:' if first else b',text:')
+                update(text_hash.encode())
+
+            elif block_type == 'tool_use':
+                # For tool_use, use tool_name + input hash (NOT tool_use_id)
+                tool_name = block.get('name', '')
+                tool_use_id = block.get('id') if input_hash_cache is not None else None
+                input_hash = input_hash_cache.get(tool_use_id) if tool_use_id else None
+                if input_hash is None:
+                    input_hash = _hash_obj(block.get('input', {}), length=8)
+                    if tool_use_id:
+                        input_hash_cache[tool_use_id] = input_hash
+                update(b'tool_use:' if first else b',tool_use:')
+                update(f"{tool_name}:{input_hash}".encode())
+
+            elif block_type == 'tool_result':
+                # For tool_result, use content hash (NOT tool_use_id reference)
+                result_content = block.get('content', '')
+                result_hash = _hash_obj(result_content, length=8)
+                update(b'tool_result:' if first else b',tool_result:')
+                update(result_hash.encode())
+
+            else:
+                continue
+            first = False
+    update(b']')
+
+
+def compute_prefix_fingerprints(messages: List[Dict],
+                                input_hash_cache: Optional[Dict[str, str]] = None,
+                                last: Optional[int] = None,
+                                raw: bool = False) -> List:
+    """
+    Compute the fingerprint of every prefix of a conversation in a single pass.
+
+    Element i is the fingerprint of messages[:i + 1], so the fingerprint of
+    messages[:-k] is element -k - 1. Fingerprints are chained (each one hashes
+    the previous digest plus the next message signature), which lets callers
+    look up several backtrack depths without rehashing the shared history.
+
+    Args:
+        messages: List of message dictionaries from API request
+        input_hash_cache: Optional tool_use_id -> input hash cache (see _update_message_signature)
+        last: Only return the fingerprints of the last `last` prefixes
+            (negative indexing is unchanged)
+        raw: Return the 8-byte digests instead of their hex form. Used for
+            internal dict keys, which are about half the size as bytes.
+
+    Returns:
+        List of 16-character hex hashes (or 8-byte digests), one per (returned) prefix
+    """
+    first_kept = len(messages) - last if last is not None else 0
+    fingerprints = []
+
+    if COMPAT_SHA256:
+        # Legacy scheme hashes the '|||'-joined signatures of each prefix;
+        # stream them into one hasher and snapshot the digest after each message
+        h = _new_hasher(16)
+        for i, msg in enumerate(messages):
+            if i:
+                h.update(b'|||')
+            _update_message_signature(h, msg, input_hash_cache)
+            if i >= first_kept:
+                fingerprints.append(h.digest()[:8] if raw else h.hexdigest()[:16])
+        return fingerprints
+
+    digest = b''
+    for i, msg in enumerate(messages):
+        h = hashlib.blake2b(digest, digest_size=8)
+        _update_message_signature(h, msg, input_hash_cache)
+        digest = h.digest()
+        if i >= first_kept:
+            fingerprints.append(digest if raw else digest.hex())
+    return fingerprints
+
+
 def compute_conversation_fingerprint(messages: List[Dict]) -> str:
     """
     Compute a unique fingerprint for a conversation based on message sequence.
@@ -78,49 +335,7 @@ def compute_conversation_fingerprint(messages: List[Dict]) -> str:
     if not messages:
         return compute_hash("empty", length=16)
 
-    fingerprint_parts = []
-
-    for msg in messages:
-        role = msg.get('role', '')
-        content = msg.get('content', [])
-
-        # Normalize content to list of blocks
-        if isinstance(content, str):
-            # Convert string content to structured format
-            content = [{'type': 'text', 'text': content}]
-        elif not isinstance(content, list):
-            content = []
-
-        # Process structured content - use role + block types + content hashes (NOT IDs)
-        block_signature = []
-        for block in content:
-            if isinstance(block, dict):
-                block_type = block.get('type', 'unknown')
-
-                if block_type == 'text':
-                    # For text blocks, use truncated hash
-                    text = block.get('text', '')
-                    text_hash = compute_hash(text, length=8)
-                    block_signature.append(f"text:{text_hash}")
-
-                elif block_type == 'tool_use':
-                    # For tool_use, use tool_name + input hash (NOT tool_use_id)
-                    tool_name = block.get('name', '')
-                    tool_input = block.get('input', {})
-                    input_hash = compute_hash(str(tool_input), length=8)
-                    block_signature.append(f"tool_use:{tool_name}:{input_hash}")
-
-                elif block_type == 'tool_result':
-                    # For tool_result, use content hash (NOT tool_use_id reference)
-                    result_content = block.get('content', '')
-                    result_hash = compute_hash(str(result_content), length=8)
-                    block_signature.append(f"tool_result:{result_hash}")
-
-        fingerprint_parts.append(f"{role}:[{','.join(block_signature)}]")
-
-    # Combine all message signatures and hash
-    combined = '|||'.join(fingerprint_parts)
-    return compute_hash(combined, length=16)
+    return compute_prefix_fingerprints(messages)[-1]
 
 
 def extract_first_user_message(messages: List[Dict]) -> str:
@@ -145,6 +360,29 @@ def extract_first_user_message(messages: List[Dict]) -> str:
     return ""
 
 
+def _parse_timestamp(timestamp: str) -> Optional[datetime]:
+    """Parse an ISO 8601 log timestamp ('Z' suffix allowed), or return None if it is missing/invalid."""
+    if not timestamp:
+        return None
+    try:
+        return datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+    except (ValueError, AttributeError):
+        return None
+
+
+def _iter_user_texts(content: Any) -> Iterator[str]:
+    """Yield the texts of a message's content, whether it is a plain string or a list of blocks."""
+    if isinstance(content, str):
+        yield content
+    elif isinstance(content, list):
+        # Blocks come from json.loads, so an exact type check is enough (and cheaper than isinstance)
+        for block in content:
+            if type(block) is dict and block.get('type') == 'text':
+                text = block.get('text', '')
+                if text:
+                    yield text
+
+
 def normalize_command(command: str) -> str:
     """
     Normalize a shell command for matching purposes.
@@ -170,16 +408,93 @@ def normalize_command(command: str) -> str:
     Returns:
         Normalized command string (alphanumeric only, lowercase)
     """
-    import re
-
     if not command:
         return ""
 
-    # Keep only alphanumeric characters (letters and digits)
-    normalized = re.sub(r'[^a-zA-Z0-9]', '', command)
+    # Keep only ASCII alphanumeric characters, lowercased, in one C-level pass
+    return command.encode('ascii', 'ignore').translate(_NORMALIZE_TABLE, _NORMALIZE_DELETE).decode('ascii')
+
+
+def normalize_commands_batch(commands: List[str]) -> List[str]:
+    """
+    Normalize many commands at once; equivalent to [normalize_command(c) for c in commands].
+
+    The commands are joined with NUL separators and pushed through a single
+    encode/translate/decode, so a bulk ingest pays the Python call overhead
+    once instead of once per command.
+
+    Args:
+        commands: Raw command strings
+
+    Returns:
+        Normalized command strings, in the same order
+    """
+    if not commands:
+        return []
+
+    joined = '\x00'.join(commands)
+    if joined.count('\x00') != len(commands) - 1:
+        # A command contains NUL itself, so the separators would be ambiguous
+        return [normalize_command(c) for c in commands]
+
+    return joined.encode('ascii', 'ignore').translate(_NORMALIZE_TABLE, _NORMALIZE_BATCH_DELETE).decode('ascii').split('\x00')
+
 
-    # Convert to lowercase for case-insensitive matching
-    return normalized.lower()
+# How many trailing messages find_parent_conversation strips when looking for
+# the conversation state this request continues (tool use/result pairs)
+MAX_PARENT_BACKTRACK = 5
+
+# Minimum normalized length for prefix/suffix command matching (avoids false positives)
+MIN_FUZZY_COMMAND_LEN = 15
+
+# Sentinel keys in _CommandTrie nodes (child keys are always 1-char strings)
+_TRIE_FIRST = 0
+_TRIE_TERMINAL = 1
+
+
+class _CommandTrie:
+    """
+    Character trie over normalized commands that remembers insertion order.
+
+    Each node keeps the earliest (order, info) entry passing through it, so
+    "earliest stored key starting with X" is a single walk down the trie.
+    """
+
+    def __init__(self):
+        self._root: Dict[Any, Any] = {}
+
+    def insert(self, key: str, order: int, info: Dict[str, Any]):
+        """Store info under key; earlier insertions win on ties."""
+        entry = (order, info)
+        node = self._root
+        for ch in key:
+            child = node.get(ch)
+            if child is None:
+                child = node[ch] = {_TRIE_FIRST: entry}
+            node = child
+        node.setdefault(_TRIE_TERMINAL, entry)
+
+    def first_with_prefix(self, prefix: str) -> Optional[tuple]:
+        """Return the earliest (order, info) whose key starts with prefix."""
+        node = self._root
+        for ch in prefix:
+            node = node.get(ch)
+            if node is None:
+                return None
+        return node.get(_TRIE_FIRST)
+
+    def earliest_prefix_of(self, text: str) -> Optional[tuple]:
+        """Return the earliest (order, info) whose key is a prefix of text."""
+        best = None
+        node = self._root
+        for ch in text:
+            node = node.get(ch)
+            if node is None:
+                break
+            entry = node.get(_TRIE_TERMINAL)
+            if entry is not None and (best is None or entry[0] < best[0]):
+                best = entry
+        return best
 
 
 class AgentInstanceTracker:
@@ -187,21 +502,40 @@ class AgentInstanceTracker:
 
     def __init__(self):
         self.instances: Dict[str, AgentInstance] = {}  # agent_id -> instance
-        self.fingerprint_to_agent: Dict[str, str] = {}  # fingerprint -> agent_id
+        self.fingerprint_to_agent: Dict[bytes, str] = {}  # raw fingerprint digest -> agent_id
         self.request_to_agent: Dict[int, str] = {}  # request_id -> agent_id
         self.task_prompts: Dict[str, Dict[str, str]] = {}  # prompt_hash -> {task_id, agent_id}
+        self._orphans_by_first_msg_hash: Dict[str, List[str]] = {}  # first_message_hash -> agent_ids with no known spawner
+        self._orphans_by_command: Dict[str, List[str]] = {}  # normalized_command -> agent_ids with no known spawner
         self.agent_counter = 0
 
         # Workflow tracking - NEW
         self.tool_use_index: Dict[str, Dict[str, Any]] = {}  # tool_use_id -> {agent_id, request_id, tool_name, timestamp}
         self.tool_result_index: Dict[str, Dict[str, Any]] = {}  # tool_use_id -> {agent_id, request_id, is_error, timestamp}
-        self.workflow_edges: List[Dict[str, Any]] = []  # All edges in the workflow DAG
+        # tool_result edges are kept as compact (tool_use_id, target_agent_id, target_request_id, is_error)
+        # tuples and only materialized as dicts on export; see workflow_edges
+        self._tool_result_edges: List[tuple] = []
+        # content_reuse and request_sequence edges, also kept as compact tuples tagged with the
+        # edge type (see _append_edge / _iter_edges)
+        self._edges: List[tuple] = []
+        self._edge_type_counts: Dict[str, int] = {}  # edge type -> count in self._edges
 
         # Content reuse tracking
-        self.response_content_index: Dict[str, List[Dict[str, Any]]] = {}  # content_hash -> [{agent_id, request_id, timestamp}]
+        # content_hash -> {agent_id -> earliest {agent_id, request_id, timestamp}}; one source per
+        # agent, since replayed responses would otherwise fan out into duplicate content_reuse edges
+        self.response_content_index: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        # (source_agent_id, target_agent_id, content_hash) of emitted content_reuse edges; replayed
+        # history would otherwise re-emit the same edge for every later request of the target agent
+        self._seen_reuse_edges: Set[tuple] = set()
 
         # Tool-spawned subagent tracking
-        self.tool_command_index: Dict[str, Dict[str, Any]] = {}  # command_hash -> {tool_use_id, agent_id, request_id, tool_name, command}
+        self.tool_command_index: Dict[str, Dict[str, Any]] = {}  # normalized_command -> {tool_use_id, agent_id, request_id, tool_name, command}
+        self._prefix_trie = _CommandTrie()  # normalized_command -> info (fuzzy prefix matching)
+        self._suffix_trie = _CommandTrie()  # reversed normalized_command -> info (fuzzy suffix matching)
+
+        # Per-tool_use_id caches; tool_use blocks are replayed unchanged in later requests
+        self._tool_input_hashes: Dict[str, str] = {}  # tool_use_id -> fingerprint input hash
+        self._normalized_commands: Dict[str, str] = {}  # tool_use_id -> normalized Bash command
 
     def compute_system_prompt_hash(self, system: List[Dict]) -> str:
         """Compute hash of system prompt."""
@@ -213,8 +547,7 @@ class AgentInstanceTracker:
                     texts.append(text)
 
         if texts:
-            combined = '|||'.join(texts)
-            return compute_hash(combined, length=16)
+            return compute_joined_hash(texts, length=16)
         return 'no_system'
 
     def identify_or_create_agent(self, request_id: int, body: Dict, timestamp: str = "") -> AgentInstance:
@@ -238,13 +571,20 @@ class AgentInstanceTracker:
         messages = body.get('messages', [])
         system_prompt = body.get('system', [])
 
-        # Compute fingerprints
-        system_prompt_hash = self.compute_system_prompt_hash(system_prompt)
-        conversation_fingerprint = compute_conversation_fingerprint(messages)
+        # Compute fingerprints (all prefixes in one pass, reused for parent lookup)
+        # Interned: every request of every agent of this type stores the same hash
+        system_prompt_hash = sys.intern(self.compute_system_prompt_hash(system_prompt))
+        # Only the last few prefixes can be a registered parent state
+        prefix_fingerprints = compute_prefix_fingerprints(messages, self._tool_input_hashes,
+                                                          last=MAX_PARENT_BACKTRACK + 1, raw=True)
+        if prefix_fingerprints:
+            conversation_fingerprint = prefix_fingerprints[-1]
+        else:
+            conversation_fingerprint = bytes.fromhex(compute_conversation_fingerprint(messages))
 
         # Check for exact match (same conversation state - replay)
-        if conversation_fingerprint in self.fingerprint_to_agent:
-            agent_id = self.fingerprint_to_agent[conversation_fingerprint]
+        agent_id = self.fingerprint_to_agent.get(conversation_fingerprint)
+        if agent_id is not None:
             agent = self.instances[agent_id]
             agent.requests.append(request_id)
             agent.last_request_id = request_id
@@ -254,7 +594,7 @@ class AgentInstanceTracker:
             return agent
 
         # Check if this is a continuation (conversation grew)
-        parent_agent = self.find_parent_conversation(messages, system_prompt_hash)
+        parent_agent = self.find_parent_conversation(messages, system_prompt_hash, prefix_fingerprints)
 
         if parent_agent:
             # This is the same agent, conversation just grew
@@ -270,32 +610,34 @@ class AgentInstanceTracker:
             return agent
 
         # New agent instance
-        agent_id = f"agent_{self.agent_counter}"
+        agent_id = sys.intern(f"agent_{self.agent_counter}")
         self.agent_counter += 1
 
         first_user_msg = extract_first_user_message(messages)
+        first_msg_hash = compute_hash(first_user_msg, length=16) if first_user_msg else None
 
         agent = AgentInstance(
             agent_id=agent_id,
             system_prompt_hash=system_prompt_hash,
             conversation_fingerprint=conversation_fingerprint,
-            requests=[request_id],
+            requests=array.array('i', [request_id]),
             first_request_id=request_id,
             last_request_id=request_id,
-            message_count_history=[len(messages)],
+            message_count_history=array.array('I', [len(messages)]),
             first_user_message=first_user_msg,
+            first_message_hash=first_msg_hash,
             timestamps=[timestamp],
         )
 
         # Check if spawned by Task tool
-        spawning_info = self.detect_task_spawn(first_user_msg)
+        spawning_info = self.detect_task_spawn(first_user_msg, first_msg_hash)
         if spawning_info:
             agent.spawned_by_task_id = spawning_info['task_id']
             agent.parent_agent_id = spawning_info['parent_agent_id']
 
             # Add to parent's child list
-            if agent.parent_agent_id and agent.parent_agent_id in self.instances:
-                parent = self.instances[agent.parent_agent_id]
+            parent = self.instances.get(agent.parent_agent_id) if agent.parent_agent_id else None
+            if parent is not None:
                 if agent_id not in parent.child_agent_ids:
                     parent.child_agent_ids.append(agent_id)
         else:
@@ -306,10 +648,18 @@ class AgentInstanceTracker:
                 agent.parent_agent_id = tool_spawn_info['parent_agent_id']
 
                 # Add to parent's child list
-                if agent.parent_agent_id and agent.parent_agent_id in self.instances:
-                    parent = self.instances[agent.parent_agent_id]
+                parent = self.instances.get(agent.parent_agent_id) if agent.parent_agent_id else None
+                if parent is not None:
                     if agent_id not in parent.child_agent_ids:
                         parent.child_agent_ids.append(agent_id)
+            else:
+                # No spawner known yet - remember it in case the Task prompt or
+                # Bash command is registered later
+                if first_msg_hash:
+                    self._orphans_by_first_msg_hash.setdefault(first_msg_hash, []).append(agent_id)
+                command = self.extract_command_from_message(first_user_msg)
+                if command:
+                    self._orphans_by_command.setdefault(normalize_command(command), []).append(agent_id)
 
         self.instances[agent_id] = agent
         self.fingerprint_to_agent[conversation_fingerprint] = agent_id
@@ -317,7 +667,8 @@ class AgentInstanceTracker:
 
         return agent
 
-    def find_parent_conversation(self, messages: List[Dict], system_prompt_hash: str) -> Optional[AgentInstance]:
+    def find_parent_conversation(self, messages: List[Dict], system_prompt_hash: str,
+                                 prefix_fingerprints: Optional[List[bytes]] = None) -> Optional[AgentInstance]:
         """
         Find if this conversation is a continuation of an existing agent.
 
@@ -327,6 +678,8 @@ class AgentInstanceTracker:
         Args:
             messages: Current message list
             system_prompt_hash: System prompt hash for this request
+            prefix_fingerprints: Precomputed compute_prefix_fingerprints(messages, raw=True), if available
+                (at least the last MAX_PARENT_BACKTRACK + 1 prefixes)
 
         Returns:
             AgentInstance if parent found, None otherwise
@@ -336,13 +689,19 @@ class AgentInstanceTracker:
 
         # Try backtracking by 1, 2, 3, ... messages to find parent conversation
         # This handles cases where conversation grew by multiple turns due to tool use/result
-        max_backtrack = min(len(messages) - 1, 5)  # Try up to 5 messages back
+        if prefix_fingerprints is None:
+            prefix_fingerprints = compute_prefix_fingerprints(messages, self._tool_input_hashes,
+                                                              last=MAX_PARENT_BACKTRACK + 1, raw=True)
+
+        # Try up to MAX_PARENT_BACKTRACK messages back
+        max_backtrack = min(len(messages) - 1, MAX_PARENT_BACKTRACK, len(prefix_fingerprints) - 1)
 
         for backtrack in range(1, max_backtrack + 1):
-            parent_fingerprint = compute_conversation_fingerprint(messages[:-backtrack])
+            # Fingerprint of messages[:-backtrack], already computed in the prefix pass
+            parent_fingerprint = prefix_fingerprints[-backtrack - 1]
 
-            if parent_fingerprint in self.fingerprint_to_agent:
-                agent_id = self.fingerprint_to_agent[parent_fingerprint]
+            agent_id = self.fingerprint_to_agent.get(parent_fingerprint)
+            if agent_id is not None:
                 agent = self.instances[agent_id]
 
                 # Verify system prompt matches (same agent type)
@@ -351,7 +710,7 @@ class AgentInstanceTracker:
 
         return None
 
-    def detect_task_spawn(self, first_user_message: str) -> Optional[Dict]:
+    def detect_task_spawn(self, first_user_message: str, msg_hash: Optional[str] = None) -> Optional[Dict]:
         """
         Detect if this agent was spawned by a Task tool.
 
@@ -359,6 +718,7 @@ class AgentInstanceTracker:
 
         Args:
             first_user_message: First user message text
+            msg_hash: Precomputed compute_hash(first_user_message, 16), if available
 
         Returns:
             Dict with task_id and parent_agent_id if match found, None otherwise
@@ -367,13 +727,11 @@ class AgentInstanceTracker:
             return None
 
         # Hash the first message
-        msg_hash = compute_hash(first_user_message, length=16)
+        if msg_hash is None:
+            msg_hash = compute_hash(first_user_message, length=16)
 
         # Look up in task prompts index
-        if msg_hash in self.task_prompts:
-            return self.task_prompts[msg_hash]
-
-        return None
+        return self.task_prompts.get(msg_hash)
 
     def extract_command_from_message(self, message: str) -> Optional[str]:
         """
@@ -393,13 +751,11 @@ class AgentInstanceTracker:
         Returns:
             Extracted command string or None
         """
-        import re
-
         if not message:
             return None
 
         # Find "Command:" in the message
-        cmd_match = re.search(r'Command:\s*', message)
+        cmd_match = _RE_COMMAND.search(message)
         if not cmd_match:
             return None
 
@@ -412,15 +768,14 @@ class AgentInstanceTracker:
 
         # Check if this is a heredoc command (contains <<'MARKER' or <<MARKER or <<"MARKER")
         # Common patterns: <<'EOF', <<EOF, <<"EOF", <<'END', etc.
-        heredoc_match = re.search(r"<<['\"]?([A-Za-z_][A-Za-z0-9_]*)['\"]?", remaining)
+        heredoc_match = _RE_HEREDOC.search(remaining)
 
         if heredoc_match:
             # This is a heredoc command - extract until the closing marker
             marker = heredoc_match.group(1)
             # Find the closing marker (on its own line, possibly with trailing )")
             # Pattern: \nMARKER followed by optional )\n or )")\n or just \n
-            close_pattern = rf'\n{re.escape(marker)}(?:\s*\)?"?\)?)?\s*(?:\n|$)'
-            close_match = re.search(close_pattern, remaining)
+            close_match = _heredoc_close_pattern(marker).search(remaining)
 
             if close_match:
                 # Extract from start to end of closing marker
@@ -432,7 +787,7 @@ class AgentInstanceTracker:
                 return first_line if first_line else None
         else:
             # Simple single-line command - extract until newline or end
-            match = re.match(r'^(.+?)(?:\n|$)', remaining)
+            match = _RE_FIRST_LINE.match(remaining)
             if match:
                 return match.group(1).strip()
 
@@ -463,28 +818,27 @@ class AgentInstanceTracker:
         # Normalize the command (alphanumeric only, lowercase)
         normalized_command = normalize_command(command)
 
-        # First try exact hash match
-        command_hash = compute_hash(normalized_command, length=16)
-        if command_hash in self.tool_command_index:
-            return self.tool_command_index[command_hash]
+        # First try exact match (the normalized string itself is the index key)
+        cmd_info = self.tool_command_index.get(normalized_command)
+        if cmd_info is not None:
+            return cmd_info
 
         # Try prefix/suffix matching for partial command matches
-        # Child command may be a prefix (truncated) or suffix (compound cmd || or &&)
-        min_len = 15  # Minimum length to avoid false positives
-        if len(normalized_command) >= min_len:
-            for cmd_hash, cmd_info in self.tool_command_index.items():
-                parent_normalized = cmd_info.get('normalized_command', '')
-                if len(parent_normalized) < min_len:
-                    continue
-                # Check if parent starts with child (child is prefix of parent)
-                if parent_normalized.startswith(normalized_command):
-                    return cmd_info
-                # Check if child starts with parent (for edge cases)
-                if normalized_command.startswith(parent_normalized):
-                    return cmd_info
-                # Check suffix: child may be latter part of compound command (|| or &&)
-                if parent_normalized.endswith(normalized_command):
-                    return cmd_info
+        # Child command may be a prefix (truncated) or suffix (compound cmd || or &&).
+        # The tries only hold commands of at least MIN_FUZZY_COMMAND_LEN, and the
+        # earliest registered match wins across all three checks.
+        if len(normalized_command) >= MIN_FUZZY_COMMAND_LEN:
+            candidates = [
+                # Parent starts with child (child is prefix of parent)
+                self._prefix_trie.first_with_prefix(normalized_command),
+                # Child starts with parent (for edge cases)
+                self._prefix_trie.earliest_prefix_of(normalized_command),
+                # Suffix: child may be latter part of compound command (|| or &&)
+                self._suffix_trie.first_with_prefix(normalized_command[::-1]),
+            ]
+            matches = [c for c in candidates if c is not None]
+            if matches:
+                return min(matches, key=lambda m: m[0])[1]
 
         return None
 
@@ -503,6 +857,39 @@ class AgentInstanceTracker:
                 'task_id': task_id,
                 'parent_agent_id': agent_id,
             }
+            self._adopt_orphans(self._orphans_by_first_msg_hash.pop(prompt_hash, ()), task_id, agent_id)
+
+    def _adopt_orphans(self, orphan_ids: Iterable[str], task_id: str, parent_agent_id: str,
+                       timestamp: str = ""):
+        """
+        Link agents created before their spawning Task prompt or Bash command was registered.
+
+        Happens with out-of-order log streams; the orphan indexes make this an
+        O(1) lookup instead of a rescan of all agents.
+
+        Args:
+            orphan_ids: Agent IDs popped from one of the orphan indexes
+            task_id: Task/Bash tool_use_id that spawned the agents
+            parent_agent_id: Agent that issued the tool call
+            timestamp: Timestamp of the spawning tool call; agents that started
+                before it (at second resolution) cannot have been spawned by it
+        """
+        for orphan_id in orphan_ids:
+            orphan = self.instances.get(orphan_id)
+            if orphan is None or orphan.parent_agent_id or orphan_id == parent_agent_id:
+                continue
+            if timestamp and orphan.timestamps and orphan.timestamps[0] \
+                    and orphan.timestamps[0][:19] < timestamp[:19]:
+                continue
+
+            orphan.spawned_by_task_id = task_id
+            orphan.parent_agent_id = parent_agent_id
+
+            # Add to parent's child list
+            parent = self.instances.get(parent_agent_id)
+            if parent is not None:
+                if orphan_id not in parent.child_agent_ids:
+                    parent.child_agent_ids.append(orphan_id)
 
     def get_agent_hierarchy(self) -> Dict[str, List[str]]:
         """
@@ -511,34 +898,36 @@ class AgentInstanceTracker:
         Returns:
             Dict mapping parent_agent_id -> list of child_agent_ids
         """
-        hierarchy = defaultdict(list)
+        hierarchy = {}
 
         for agent_id, agent in self.instances.items():
             if agent.parent_agent_id:
-                hierarchy[agent.parent_agent_id].append(agent_id)
+                hierarchy.setdefault(agent.parent_agent_id, []).append(agent_id)
 
-        return dict(hierarchy)
+        return hierarchy
 
     def get_statistics(self) -> Dict[str, Any]:
         """Get statistics about tracked agents."""
         total_agents = len(self.instances)
-        total_requests = sum(len(agent.requests) for agent in self.instances.values())
+        total_requests = 0
+        child_agents = 0
+        agent_types = {}
 
-        root_agents = [a for a in self.instances.values() if not a.parent_agent_id]
-        child_agents = [a for a in self.instances.values() if a.parent_agent_id]
-
-        agent_types = defaultdict(int)
+        # Single pass over all agents
         for agent in self.instances.values():
-            agent_types[agent.system_prompt_hash] += 1
+            total_requests += len(agent.requests)
+            if agent.parent_agent_id:
+                child_agents += 1
+            agent_types[agent.system_prompt_hash] = agent_types.get(agent.system_prompt_hash, 0) + 1
 
         return {
             'total_agents': total_agents,
             'total_requests': total_requests,
             'avg_requests_per_agent': total_requests / total_agents if total_agents > 0 else 0,
-            'root_agents': len(root_agents),
-            'child_agents': len(child_agents),
+            'root_agents': total_agents - child_agents,
+            'child_agents': child_agents,
             'unique_agent_types': len(agent_types),
-            'agent_type_distribution': dict(agent_types),
+            'agent_type_distribution': agent_types,
         }
 
     def export_all_instances(self) -> List[Dict[str, Any]]:
@@ -564,6 +953,10 @@ class AgentInstanceTracker:
         if not agent_id:
             return
 
+        # IDs and tool names recur in every replay of the conversation; keep one copy
+        tool_use_id = sys.intern(tool_use_id)
+        tool_name = sys.intern(tool_name) if tool_name else tool_name
+
         # Store in index - only if not already seen (keep FIRST occurrence)
         # This is critical because the same tool_use_id appears in conversation
         # history across multiple requests, and we want the request where
@@ -607,6 +1000,8 @@ class AgentInstanceTracker:
                         'subagent_type': subagent_type,
                         'prompt': prompt[:200],
                     }
+                    self._adopt_orphans(self._orphans_by_first_msg_hash.pop(prompt_hash, ()),
+                                        tool_use_id, agent_id, timestamp)
 
         # Special handling for Bash tool (potential subagent spawn)
         elif tool_name == 'Bash':
@@ -615,11 +1010,13 @@ class AgentInstanceTracker:
 
             if command:
                 # Normalize and index the command for later matching (only first occurrence)
-                normalized_command = normalize_command(command)
-                command_hash = compute_hash(normalized_command, length=16)
+                normalized_command = self._normalized_commands.get(tool_use_id)
+                if normalized_command is None:
+                    normalized_command = normalize_command(command)
+                    self._normalized_commands[tool_use_id] = normalized_command
 
-                if command_hash not in self.tool_command_index:
-                    self.tool_command_index[command_hash] = {
+                if normalized_command not in self.tool_command_index:
+                    cmd_info = {
                         'tool_use_id': tool_use_id,
                         'parent_agent_id': agent_id,
                         'request_id': request_id,
@@ -627,6 +1024,15 @@ class AgentInstanceTracker:
                         'command': command,
                         'normalized_command': normalized_command,
                     }
+                    order = len(self.tool_command_index)
+                    self.tool_command_index[normalized_command] = cmd_info
+
+                    if len(normalized_command) >= MIN_FUZZY_COMMAND_LEN:
+                        self._prefix_trie.insert(normalized_command, order, cmd_info)
+                        self._suffix_trie.insert(normalized_command[::-1], order, cmd_info)
+
+                    self._adopt_orphans(self._orphans_by_command.pop(normalized_command, ()),
+                                        tool_use_id, agent_id, timestamp)
 
     def track_tool_result(self, request_id: int, tool_result_block: Dict[str, Any], timestamp: str = ""):
         """
@@ -647,6 +1053,8 @@ class AgentInstanceTracker:
         if not agent_id:
             return
 
+        tool_use_id = sys.intern(tool_use_id)
+
         # Store in index
         self.tool_result_index[tool_use_id] = {
             'tool_use_id': tool_use_id,
@@ -665,24 +1073,72 @@ class AgentInstanceTracker:
             'is_error': is_error,
         })
 
-        # Create workflow edge: tool_use -> tool_result
+        # Create workflow edge: tool_use -> tool_result (source side is joined
+        # from tool_use_index when the edge is materialized)
         if tool_use_id in self.tool_use_index:
-            tool_use_info = self.tool_use_index[tool_use_id]
-            source_agent_id = tool_use_info['agent_id']
-            target_agent_id = agent_id
+            self._tool_result_edges.append((tool_use_id, agent_id, request_id, is_error))
+
+    def _iter_tool_result_edges(self):
+        """Materialize tool_result edges from their compact tuples."""
+        tool_use_index = self.tool_use_index
+        for tool_use_id, target_agent_id, target_request_id, is_error in self._tool_result_edges:
+            tool_use_info = tool_use_index[tool_use_id]
 
             # Edge from agent that used tool to agent that received result
-            self.workflow_edges.append({
+            yield {
                 'type': 'tool_result',
-                'source_agent_id': source_agent_id,
+                'source_agent_id': tool_use_info['agent_id'],
                 'target_agent_id': target_agent_id,
                 'tool_use_id': tool_use_id,
                 'tool_name': tool_use_info['tool_name'],
                 'source_request_id': tool_use_info['request_id'],
-                'target_request_id': request_id,
+                'target_request_id': target_request_id,
                 'is_error': is_error,
                 'confidence': 1.0,  # Exact match via tool_use_id
-            })
+            }
+
+    def _append_edge(self, edge: tuple):
+        """
+        Append a compact content_reuse/request_sequence edge, keeping the per-type counts current.
+
+        Edges are tuples starting with their type:
+        ('content_reuse', source_agent_id, target_agent_id, source_request_id, target_request_id, content_hash)
+        ('request_sequence', agent_id, source_request_id, target_request_id, time_gap_ms)
+        """
+        self._edges.append(edge)
+        edge_type = edge[0]
+        self._edge_type_counts[edge_type] = self._edge_type_counts.get(edge_type, 0) + 1
+
+    def _iter_edges(self):
+        """Materialize content_reuse and request_sequence edges from their compact tuples."""
+        for edge in self._edges:
+            if edge[0] == 'content_reuse':
+                _, source_agent_id, target_agent_id, source_request_id, target_request_id, content_hash = edge
+                yield {
+                    'type': 'content_reuse',
+                    'source_agent_id': source_agent_id,
+                    'target_agent_id': target_agent_id,
+                    'source_request_id': source_request_id,
+                    'target_request_id': target_request_id,
+                    'content_hash': content_hash,
+                    'confidence': 0.85,
+                }
+            else:
+                _, agent_id, source_request_id, target_request_id, time_gap_ms = edge
+                yield {
+                    'type': 'request_sequence',
+                    'source_agent_id': agent_id,
+                    'target_agent_id': agent_id,
+                    'source_request_id': source_request_id,
+                    'target_request_id': target_request_id,
+                    'time_gap_ms': time_gap_ms,
+                    'confidence': 1.0,
+                }
+
+    @property
+    def workflow_edges(self) -> List[Dict[str, Any]]:
+        """All edges in the workflow DAG (tool_result, content_reuse, request_sequence)."""
+        return list(self._iter_tool_result_edges()) + list(self._iter_edges())
 
     def build_workflow_dag(self) -> Dict[str, Any]:
         """
@@ -693,8 +1149,11 @@ class AgentInstanceTracker:
         """
         nodes = []
         edges = []
+        root_agent_ids = []
+        leaf_count = 0
+        spawn_count = 0
 
-        # Create nodes from agent instances
+        # Create nodes from agent instances (root/leaf metrics are gathered in the same pass)
         for agent_id, agent in self.instances.items():
             node = {
                 'id': agent_id,
@@ -712,6 +1171,10 @@ class AgentInstanceTracker:
                 'is_leaf': len(agent.child_agent_ids) == 0,
             }
             nodes.append(node)
+            if node['is_root']:
+                root_agent_ids.append(agent_id)
+            if node['is_leaf']:
+                leaf_count += 1
 
         # Add parent-child edges (subagent spawns)
         for agent_id, agent in self.instances.items():
@@ -724,18 +1187,18 @@ class AgentInstanceTracker:
                 spawned_by_tool_use_id = agent.spawned_by_task_id
 
                 # Check if spawned by tool call (Bash, etc.)
-                if spawned_by_tool_use_id and spawned_by_tool_use_id in self.tool_use_index:
-                    tool_info = self.tool_use_index[spawned_by_tool_use_id]
+                tool_info = self.tool_use_index.get(spawned_by_tool_use_id) if spawned_by_tool_use_id else None
+                if tool_info is not None:
                     tool_name = tool_info.get('tool_name')
                     source_request_id = tool_info.get('request_id')  # NEW: Get spawning request
 
                     if tool_name != 'Task':
                         spawn_method = 'tool_call'
 
-                        # Get command hash if available
-                        for cmd_hash, cmd_info in self.tool_command_index.items():
+                        # Get command hash if available (only surfaced here, so computed lazily)
+                        for cmd_info in self.tool_command_index.values():
                             if cmd_info['tool_use_id'] == spawned_by_tool_use_id:
-                                command_hash = cmd_hash
+                                command_hash = compute_hash(cmd_info['normalized_command'], length=16)
                                 break
 
                 edge = {
@@ -756,49 +1219,53 @@ class AgentInstanceTracker:
                     edge['command_hash'] = command_hash
 
                 edges.append(edge)
+                spawn_count += 1
 
         # Build request sequence edges
         self.build_request_sequence_edges()
 
         # Add all workflow edges (tool_result, content_reuse, request_sequence)
-        edges.extend(self.workflow_edges)
+        edges.extend(self._iter_tool_result_edges())
+        edges.extend(self._iter_edges())
 
-        # Compute DAG metrics
-        root_agents = [n for n in nodes if n['is_root']]
-        leaf_agents = [n for n in nodes if n['is_leaf']]
+        # Compute DAG metrics (edge counts are maintained as the edges are created)
+        type_counts = self._edge_type_counts
 
         return {
             'nodes': nodes,
             'edges': edges,
             'metrics': {
                 'total_agents': len(nodes),
-                'root_agents': len(root_agents),
-                'leaf_agents': len(leaf_agents),
+                'root_agents': len(root_agent_ids),
+                'leaf_agents': leaf_count,
                 'total_edges': len(edges),
-                'spawn_edges': len([e for e in edges if e['type'] == 'subagent_spawn']),
-                'tool_result_edges': len([e for e in edges if e['type'] == 'tool_result']),
-                'content_reuse_edges': len([e for e in edges if e['type'] == 'content_reuse']),
-                'request_sequence_edges': len([e for e in edges if e['type'] == 'request_sequence']),
+                'spawn_edges': spawn_count,
+                'tool_result_edges': len(self._tool_result_edges),
+                'content_reuse_edges': type_counts.get('content_reuse', 0),
+                'request_sequence_edges': type_counts.get('request_sequence', 0),
             },
-            'root_agent_ids': [n['id'] for n in root_agents],
+            'root_agent_ids': root_agent_ids,
         }
 
     def get_agent_tree(self, root_agent_id: str, depth: int = 0) -> Dict[str, Any]:
         """
         Get tree structure starting from a root agent (for visualization).
 
+        Walks the spawn hierarchy with an explicit stack, so deep spawn chains
+        cannot hit the recursion limit and a cyclic parent link is only
+        expanded once.
+
         Args:
             root_agent_id: Agent ID to start from
-            depth: Current depth (for recursion)
+            depth: Depth assigned to the root node
 
         Returns:
             Tree structure with agent and children
         """
-        if root_agent_id not in self.instances:
+        agent = self.instances.get(root_agent_id)
+        if agent is None:
             return None
 
-        agent = self.instances[root_agent_id]
-
         tree = {
             'agent_id': agent.agent_id,
             'agent_type': agent.system_prompt_hash,
@@ -807,11 +1274,29 @@ class AgentInstanceTracker:
             'children': [],
         }
 
-        # Recursively add children
-        for child_id in agent.child_agent_ids:
-            child_tree = self.get_agent_tree(child_id, depth + 1)
-            if child_tree:
-                tree['children'].append(child_tree)
+        # Depth-first, children in order: each stack entry is (node, remaining child ids)
+        visited = {root_agent_id}
+        stack = [(tree, iter(agent.child_agent_ids))]
+        while stack:
+            node, child_ids = stack[-1]
+            for child_id in child_ids:
+                child = self.instances.get(child_id)
+                if child is None or child_id in visited:
+                    continue
+                visited.add(child_id)
+
+                child_tree = {
+                    'agent_id': child.agent_id,
+                    'agent_type': child.system_prompt_hash,
+                    'depth': node['depth'] + 1,
+                    'request_count': len(child.requests),
+                    'children': [],
+                }
+                node['children'].append(child_tree)
+                stack.append((child_tree, iter(child.child_agent_ids)))
+                break
+            else:
+                stack.pop()
 
         return tree
 
@@ -828,10 +1313,10 @@ class AgentInstanceTracker:
         if not agent_id:
             return
 
-        # Extract text content from response
+        # Extract text content from response (blocks are plain dicts from json.loads)
         text_parts = []
         for block in content_blocks:
-            if isinstance(block, dict) and block.get('type') == 'text':
+            if type(block) is dict and block.get('type') == 'text':
                 text = block.get('text', '')
                 if text:
                     text_parts.append(text)
@@ -839,20 +1324,18 @@ class AgentInstanceTracker:
         if not text_parts:
             return
 
-        # Hash first 200 chars of combined text
-        combined_text = '\n'.join(text_parts)
-        normalized = ' '.join(combined_text.split())[:200]
-        content_hash = compute_hash(normalized, length=16)
+        # Hash first 200 chars of combined (whitespace-collapsed) text
+        content_hash = _normalize_and_hash('\n'.join(text_parts))
 
-        if content_hash not in self.response_content_index:
-            self.response_content_index[content_hash] = []
-
-        self.response_content_index[content_hash].append({
-            'agent_id': agent_id,
-            'request_id': request_id,
-            'timestamp': timestamp,
-            'content_hash': content_hash,
-        })
+        sources = self.response_content_index.setdefault(content_hash, {})
+        existing = sources.get(agent_id)
+        if existing is None or request_id < existing['request_id']:
+            sources[agent_id] = {
+                'agent_id': agent_id,
+                'request_id': request_id,
+                'timestamp': timestamp,
+                'content_hash': content_hash,
+            }
 
     def track_request_content(self, request_id: int, messages: List[Dict], timestamp: str = ""):
         """
@@ -867,6 +1350,15 @@ class AgentInstanceTracker:
         if not agent_id:
             return
 
+        # Nothing to match against until the first response text has been indexed
+        if not self.response_content_index:
+            return
+
+        # Runs for every replayed message of every request; bind the hot lookups once
+        normalize_and_hash = _normalize_and_hash
+        get_sources = self.response_content_index.get
+        seen_reuse_edges = self._seen_reuse_edges
+
         # Extract text from user messages
         for message in messages:
             if not isinstance(message, dict):
@@ -875,94 +1367,47 @@ class AgentInstanceTracker:
             if message.get('role') != 'user':
                 continue
 
-            content = message.get('content', '')
-
-            # Handle string content
-            if isinstance(content, str):
-                normalized = ' '.join(content.split())[:200]
-                content_hash = compute_hash(normalized, length=16)
-
-                if content_hash in self.response_content_index:
-                    for source_info in self.response_content_index[content_hash]:
-                        source_agent_id = source_info['agent_id']
-                        source_request_id = source_info['request_id']
-
-                        # Only create edge if source comes before target and different agents
-                        if source_request_id < request_id and source_agent_id != agent_id:
-                            self.workflow_edges.append({
-                                'type': 'content_reuse',
-                                'source_agent_id': source_agent_id,
-                                'target_agent_id': agent_id,
-                                'source_request_id': source_request_id,
-                                'target_request_id': request_id,
-                                'content_hash': content_hash,
-                                'confidence': 0.85,
-                            })
-
-            # Handle array content
-            elif isinstance(content, list):
-                for block in content:
-                    if isinstance(block, dict) and block.get('type') == 'text':
-                        text = block.get('text', '')
-                        if text:
-                            normalized = ' '.join(text.split())[:200]
-                            content_hash = compute_hash(normalized, length=16)
-
-                            if content_hash in self.response_content_index:
-                                for source_info in self.response_content_index[content_hash]:
-                                    source_agent_id = source_info['agent_id']
-                                    source_request_id = source_info['request_id']
-
-                                    if source_request_id < request_id and source_agent_id != agent_id:
-                                        self.workflow_edges.append({
-                                            'type': 'content_reuse',
-                                            'source_agent_id': source_agent_id,
-                                            'target_agent_id': agent_id,
-                                            'source_request_id': source_request_id,
-                                            'target_request_id': request_id,
-                                            'content_hash': content_hash,
-                                            'confidence': 0.85,
-                                        })
+            # String content and text blocks are matched the same way
+            for text in _iter_user_texts(message.get('content', '')):
+                content_hash = normalize_and_hash(text)
+
+                sources = get_sources(content_hash)
+                if not sources:
+                    continue
+
+                for source_info in sources.values():
+                    source_agent_id = source_info['agent_id']
+                    source_request_id = source_info['request_id']
+
+                    # Only create edge if source comes before target and different agents
+                    if source_request_id < request_id and source_agent_id != agent_id:
+                        edge_key = (source_agent_id, agent_id, content_hash)
+                        if edge_key in seen_reuse_edges:
+                            continue
+                        seen_reuse_edges.add(edge_key)
+
+                        self._append_edge(('content_reuse', source_agent_id, agent_id,
+                                           source_request_id, request_id, content_hash))
 
     def build_request_sequence_edges(self):
         """
         Build request sequence edges for each agent showing temporal flow.
         Creates edges between consecutive requests within the same agent.
         """
-        from datetime import datetime
-
         for agent_id, agent in self.instances.items():
             if len(agent.requests) < 2:
                 continue
 
-            # Sort requests with timestamps
-            request_times = []
-            for i, req_id in enumerate(agent.requests):
-                timestamp = agent.timestamps[i] if i < len(agent.timestamps) else None
-                request_times.append((req_id, timestamp))
+            # Each timestamp is parsed once (consecutive pairs share their middle one);
+            # requests without a recorded timestamp get None
+            parsed_times = itertools.chain(map(_parse_timestamp, agent.timestamps), itertools.repeat(None))
 
             # Create edges between consecutive requests
-            for i in range(len(request_times) - 1):
-                source_req_id, source_time = request_times[i]
-                target_req_id, target_time = request_times[i + 1]
-
+            for (source_req_id, source_dt), (target_req_id, target_dt) in \
+                    itertools.pairwise(zip(agent.requests, parsed_times)):
                 # Calculate time gap
                 time_gap_ms = None
-                if source_time and target_time:
-                    try:
-                        source_dt = datetime.fromisoformat(source_time.replace('Z', '+00:00'))
-                        target_dt = datetime.fromisoformat(target_time.replace('Z', '+00:00'))
-                        time_gap_ms = int((target_dt - source_dt).total_seconds() * 1000)
-                    except (ValueError, AttributeError):
-                        pass
-
-                self.workflow_edges.append({
-                    'type': 'request_sequence',
-                    'source_agent_id': agent_id,
-                    'target_agent_id': agent_id,
-                    'source_request_id': source_req_id,
-                    'target_request_id': target_req_id,
-                    'time_gap_ms': time_gap_ms,
-                    'confidence': 1.0,
-                })
+                if source_dt is not None and target_dt is not None:
+                    time_gap_ms = int((target_dt - source_dt).total_seconds() * 1000)
 
+                self._append_edge(('request_sequence', agent_id, source_req_id, target_req_id, time_gap_ms))
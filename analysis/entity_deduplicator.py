@@ -6,7 +6,7 @@ Tracks entity occurrences across multiple requests and marks duplicates
 caused by conversation history replay.
 """
 
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Set
 from collections import defaultdict
 
 
@@ -22,8 +22,13 @@ class EntityDeduplicator:
         """
         self.agent_tracker = agent_tracker
         self.unique_entities: Dict[str, Dict] = {}  # entity_id -> entity with metadata
+        # entity_id -> set mirror of the entity's 'seen_in_agents' list, for O(1) membership checks.
+        # The list itself stays a list: it is part of the returned (and JSON-exported) entity.
+        self._seen_agent_sets: Dict[str, Set[str]] = {}
+        self._agent_to_entities: Dict[str, List[str]] = {}  # first_seen_agent -> entity_ids, in first-seen order
         self.entity_type_counts: Dict[str, int] = defaultdict(int)
         self.entity_type_duplicates: Dict[str, int] = defaultdict(int)
+        self._total_occurrences = 0  # sum of occurrence_count over unique_entities, kept incrementally
     
     def deduplicate_entity(self, entity: Dict, entity_type: str, request_id: int) -> Dict:
         """
@@ -40,28 +45,28 @@ class EntityDeduplicator:
         entity_id = entity.get('id')
         if not entity_id:
             # No ID, cannot deduplicate - treat as unique
-            return {
-                **entity,
-                'is_duplicate': False,
-                'entity_type': entity_type,
-            }
+            enriched = entity.copy()
+            enriched['is_duplicate'] = False
+            enriched['entity_type'] = entity_type
+            return enriched
         
         agent_id = self.agent_tracker.request_to_agent.get(request_id)
+        self._total_occurrences += 1
         
         if entity_id not in self.unique_entities:
             # First occurrence
-            enriched = {
-                **entity,
-                'entity_type': entity_type,
-                'is_duplicate': False,
-                'first_seen_request': request_id,
-                'first_seen_agent': agent_id,
-                'occurrence_count': 1,
-                'seen_in_requests': [request_id],
-                'seen_in_agents': [agent_id] if agent_id else [],
-            }
+            enriched = entity.copy()
+            enriched['entity_type'] = entity_type
+            enriched['is_duplicate'] = False
+            enriched['first_seen_request'] = request_id
+            enriched['first_seen_agent'] = agent_id
+            enriched['occurrence_count'] = 1
+            enriched['seen_in_requests'] = [request_id]
+            enriched['seen_in_agents'] = [agent_id] if agent_id else []
             
             self.unique_entities[entity_id] = enriched
+            self._seen_agent_sets[entity_id] = {agent_id} if agent_id else set()
+            self._agent_to_entities.setdefault(agent_id, []).append(entity_id)
             self.entity_type_counts[entity_type] += 1
             return enriched
         
@@ -71,20 +76,24 @@ class EntityDeduplicator:
             unique_entity['occurrence_count'] += 1
             unique_entity['seen_in_requests'].append(request_id)
             
-            if agent_id and agent_id not in unique_entity['seen_in_agents']:
-                unique_entity['seen_in_agents'].append(agent_id)
+            if agent_id:
+                seen_agents = self._seen_agent_sets[entity_id]
+                if agent_id not in seen_agents:
+                    seen_agents.add(agent_id)
+                    unique_entity['seen_in_agents'].append(agent_id)
             
             self.entity_type_duplicates[entity_type] += 1
             
-            return {
-                **entity,
-                'entity_type': entity_type,
-                'is_duplicate': True,
-                'duplicate_of': entity_id,
-                'first_seen_request': unique_entity['first_seen_request'],
-                'first_seen_agent': unique_entity['first_seen_agent'],
-                'occurrence_count': unique_entity['occurrence_count'],
-            }
+            # Duplicates are the common case (history replay), so copy the
+            # entity and set the few extra keys rather than rebuilding via unpacking
+            enriched = entity.copy()
+            enriched['entity_type'] = entity_type
+            enriched['is_duplicate'] = True
+            enriched['duplicate_of'] = entity_id
+            enriched['first_seen_request'] = unique_entity['first_seen_request']
+            enriched['first_seen_agent'] = unique_entity['first_seen_agent']
+            enriched['occurrence_count'] = unique_entity['occurrence_count']
+            return enriched
     
     def get_unique_entities_only(self, entity_type: Optional[str] = None) -> List[Dict]:
         """
@@ -106,7 +115,7 @@ class EntityDeduplicator:
     def get_deduplication_stats(self) -> Dict:
         """Get statistics on deduplication."""
         total_unique = len(self.unique_entities)
-        total_occurrences = sum(e['occurrence_count'] for e in self.unique_entities.values())
+        total_occurrences = self._total_occurrences
         
         # Stats by entity type
         type_stats = {}
@@ -136,10 +145,7 @@ class EntityDeduplicator:
     
     def get_entities_by_agent(self, agent_id: str) -> List[Dict]:
         """Get all unique entities first seen by a specific agent."""
-        return [
-            e for e in self.unique_entities.values()
-            if e.get('first_seen_agent') == agent_id
-        ]
+        return [self.unique_entities[entity_id] for entity_id in self._agent_to_entities.get(agent_id, ())]
     
     def get_cross_agent_entities(self) -> List[Dict]:
         """Get entities that appear in multiple agents (shared entities)."""
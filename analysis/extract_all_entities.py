@@ -17,27 +17,81 @@ This script identifies and extracts all entities created during the workflow:
 """
 
 import json
+import re
 import sys
 from pathlib import Path
-from typing import Dict, List, Any, Set, Tuple
-from collections import defaultdict
+from typing import Dict, List, Any, Optional, Set, Tuple
+from collections import Counter, defaultdict
 from datetime import datetime
-import hashlib
+
+try:
+    import orjson
+except ImportError:  # optional speedup, falls back to stdlib json
+    orjson = None
 
 # Import agent tracking and deduplication
-from .agent_tracker import AgentInstanceTracker
+# Hashing is shared so system prompt hashes match agent_instances' system_prompt_hash
+from .agent_tracker import AgentInstanceTracker, compute_joined_hash
 from .entity_deduplicator import EntityDeduplicator
 
+# Request body keys that are broken out into their own entities (messages, system
+# prompts, tool definitions); api_requests only keeps the remaining request parameters
+_EXTRACTED_BODY_KEYS = frozenset(('messages', 'system', 'tools'))
+
+# Agent ID reported in Task tool results ("agentId: <hex>")
+_RE_AGENT_ID = re.compile(r'agentId:\s*([a-f0-9]+)')
+
+
+def _intern_str(value: Any) -> Any:
+    """
+    Intern enum-like string fields (role, block type, tool name, subagent type).
+
+    They take a handful of distinct values but the JSON decoder creates a new
+    string for every occurrence; interning lets all entities share one object.
+    """
+    return sys.intern(value) if type(value) is str else value
 
-def compute_hash(text: str, length: int = 16) -> str:
-    """Compute a short hash of text."""
-    return hashlib.sha256(text.encode()).hexdigest()[:length]
+
+def _write_json_streamed(f, obj: Any, depth: int = 0, max_depth: int = 2):
+    """
+    Write obj as 2-space indented JSON, serializing one sub-value at a time.
+
+    The top `max_depth` levels of dicts are written key by key, so only one
+    entity list is ever held as serialized bytes instead of the whole export.
+    The output is byte-identical to orjson.dumps(obj, option=OPT_INDENT_2).
+    """
+    if depth < max_depth and isinstance(obj, dict) and obj:
+        inner_indent = b'\n' + b'  ' * (depth + 1)
+        f.write(b'{')
+        for i, (key, value) in enumerate(obj.items()):
+            if i:
+                f.write(b',')
+            f.write(inner_indent + orjson.dumps(str(key)) + b': ')
+            _write_json_streamed(f, value, depth + 1, max_depth)
+        f.write(b'\n' + b'  ' * depth + b'}')
+        return
+
+    # request_id-keyed relationship maps have int keys, which json.dump stringifies
+    chunk = orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    if depth:
+        # Raw newlines only occur between tokens (never inside JSON strings)
+        chunk = chunk.replace(b'\n', b'\n' + b'  ' * depth)
+    f.write(chunk)
 
 
 class EntityExtractor:
     """Extract all entities from Claude Code workflow logs."""
 
-    def __init__(self):
+    def __init__(self, keep_body: bool = False):
+        """
+        Args:
+            keep_body: Store the full request body on each api_requests entity. By default
+                the messages/system/tools are left out: they are extracted as separate
+                entities, and keeping them here holds (and exports) every replayed
+                history a second time.
+        """
+        self.keep_body = keep_body
+
         # Entity storage
         self.api_requests = []
         self.api_responses = []
@@ -49,6 +103,8 @@ class EntityExtractor:
         self.tasks = []  # Special: Task tool uses
         self.agents = {}  # agent_id -> agent info
         self.system_prompts = {}  # hash -> prompt text
+        self._last_system_texts = None  # texts/hash of the last system prompt seen (see extract_system_prompt)
+        self._last_system_hash = None
         self.content_blocks = []
 
         # Relationship tracking
@@ -65,15 +121,25 @@ class EntityExtractor:
         # Agent tracking and deduplication
         self.agent_tracker = AgentInstanceTracker()
         self.deduplicator = EntityDeduplicator(self.agent_tracker)
+
+        # block type -> handler filling in the type-specific fields of a content block
+        self._block_handlers = {
+            'text': self._extract_text_block,
+            'tool_use': self._extract_tool_use_block,
+            'tool_result': self._extract_tool_result_block,
+        }
         
     def extract_from_log_file(self, log_path: Path):
         """Extract all entities from a single log file."""
         print(f"Processing {log_path}...")
         
-        with open(log_path, 'r') as f:
+        # Decoding dominates extraction time; orjson parses bytes lines directly
+        # (orjson.JSONDecodeError subclasses json.JSONDecodeError)
+        loads = orjson.loads if orjson is not None else json.loads
+        with open(log_path, 'rb') as f:
             for line_num, line in enumerate(f, 1):
                 try:
-                    entry = json.loads(line)
+                    entry = loads(line)
                     self.process_log_entry(entry, line_num)
                 except json.JSONDecodeError as e:
                     print(f"Error parsing line {line_num}: {e}", file=sys.stderr)
@@ -92,6 +158,11 @@ class EntityExtractor:
         # IDENTIFY AGENT INSTANCE (with timestamp)
         agent_instance = self.agent_tracker.identify_or_create_agent(request_id, body, timestamp)
 
+        if self.keep_body:
+            stored_body = body
+        else:
+            stored_body = {k: v for k, v in body.items() if k not in _EXTRACTED_BODY_KEYS}
+
         request_entity = {
             'id': f'req_{request_id}',
             'line_num': line_num,
@@ -100,7 +171,7 @@ class EntityExtractor:
             'path': entry.get('path'),
             'url': entry.get('url'),
             'headers': entry.get('headers', {}),
-            'body': body,
+            'body': stored_body,
             # Agent tracking metadata
             'agent_id': agent_instance.agent_id,
             'agent_type': agent_instance.system_prompt_hash,
@@ -145,12 +216,21 @@ class EntityExtractor:
                     texts.append(text)
         
         if texts:
-            combined = '|||'.join(texts)
-            prompt_hash = compute_hash(combined, length=16)
+            # Consecutive requests nearly always carry the same system prompt; comparing
+            # the texts against the previous request's is cheaper than rehashing them
+            texts = tuple(texts)
+            if texts == self._last_system_texts:
+                prompt_hash = self._last_system_hash
+            else:
+                prompt_hash = compute_joined_hash(texts, length=16)
+                self._last_system_texts = texts
+                self._last_system_hash = prompt_hash
+
+            # Only build the combined text the first time this prompt is seen
             if prompt_hash not in self.system_prompts:
                 self.system_prompts[prompt_hash] = {
                     'hash': prompt_hash,
-                    'text': combined,
+                    'text': '|||'.join(texts),
                     'first_seen_request': request_id,
                 }
     
@@ -174,8 +254,10 @@ class EntityExtractor:
             message_id = f'msg_{self.message_counter}'
             self.message_counter += 1
 
-            role = msg.get('role')
+            role = _intern_str(msg.get('role'))
             content = msg.get('content')
+            # Exact type checks below: content comes straight from the JSON decoder
+            content_type = type(content)
 
             message_entity = {
                 'id': message_id,
@@ -183,12 +265,12 @@ class EntityExtractor:
                 'role': role,
                 'timestamp': timestamp,
                 'position_in_conversation': msg_idx,
-                'content_type': type(content).__name__,
+                'content_type': content_type.__name__,
                 'content_blocks': [],
             }
 
             # Extract content blocks
-            if isinstance(content, str):
+            if content_type is str:
                 # Simple text message
                 block_id = f'block_{self.content_block_counter}'
                 self.content_block_counter += 1
@@ -201,21 +283,32 @@ class EntityExtractor:
                 self.content_blocks.append(block)
                 message_entity['content_blocks'].append(block_id)
 
-            elif isinstance(content, list):
+            elif content_type is list:
                 # Structured content with multiple blocks
                 for block_idx, item in enumerate(content):
-                    if isinstance(item, dict):
-                        block_id = self.extract_content_block(item, message_id, block_idx, request_id)
+                    if type(item) is dict:
+                        block_id = self.extract_content_block(item, message_id, block_idx, request_id, timestamp)
                         message_entity['content_blocks'].append(block_id)
 
             self.messages.append(message_entity)
 
-    def extract_content_block(self, block: Dict, message_id: str, position: int, request_id: int = None) -> str:
-        """Extract a single content block (text, tool_use, tool_result)."""
+    def extract_content_block(self, block: Dict, message_id: str, position: int, request_id: int = None,
+                              timestamp: Optional[str] = None) -> str:
+        """
+        Extract a single content block (text, tool_use, tool_result).
+
+        timestamp is the request timestamp; callers pass it through so it is not
+        looked up again per block (it is only looked up here when omitted).
+        """
+        if timestamp is None:
+            timestamp = ""
+            if request_id is not None and request_id < len(self.api_requests):
+                timestamp = self.api_requests[request_id].get('timestamp', '')
+
         block_id = f'block_{self.content_block_counter}'
         self.content_block_counter += 1
 
-        block_type = block.get('type')
+        block_type = _intern_str(block.get('type'))
 
         block_entity = {
             'id': block_id,
@@ -224,113 +317,117 @@ class EntityExtractor:
             'type': block_type,
         }
 
-        if block_type == 'text':
-            block_entity['text'] = block.get('text', '')
+        # Dispatch on block type (see _block_handlers); unknown types keep only the common fields
+        handler = self._block_handlers.get(block_type)
+        if handler is not None:
+            handler(block, block_entity, block_id, message_id, request_id, timestamp)
+
+        self.content_blocks.append(block_entity)
+        return block_id
+
+    def _extract_text_block(self, block: Dict, block_entity: Dict, block_id: str,
+                            message_id: str, request_id: int = None, timestamp: str = ""):
+        """Fill in a text block."""
+        block_entity['text'] = block.get('text', '')
+
+    def _extract_tool_use_block(self, block: Dict, block_entity: Dict, block_id: str,
+                                message_id: str, request_id: int = None, timestamp: str = ""):
+        """Fill in a tool_use block and record the tool use (and Task) entities."""
+        tool_use_id = block.get('id')
+        tool_name = _intern_str(block.get('name'))
+        tool_input = block.get('input', {})
+
+        block_entity['tool_use_id'] = tool_use_id
+        block_entity['tool_name'] = tool_name
+        block_entity['tool_input'] = tool_input
+
+        # Create tool use entity
+        tool_use_entity = {
+            'id': tool_use_id,
+            'block_id': block_id,
+            'message_id': message_id,
+            'tool_name': tool_name,
+            'input': tool_input,
+        }
+
+        # Apply deduplication if request_id available
+        if request_id is not None:
+            tool_use_entity = self.deduplicator.deduplicate_entity(
+                tool_use_entity, 'tool_use', request_id
+            )
 
-        elif block_type == 'tool_use':
-            tool_use_id = block.get('id')
-            tool_name = block.get('name')
-            tool_input = block.get('input', {})
+            # Track tool use in agent tracker (for workflow DAG)
+            self.agent_tracker.track_tool_use(request_id, block, timestamp)
 
-            block_entity['tool_use_id'] = tool_use_id
-            block_entity['tool_name'] = tool_name
-            block_entity['tool_input'] = tool_input
+        self.tool_uses.append(tool_use_entity)
 
-            # Create tool use entity
-            tool_use_entity = {
+        # Special handling for Task tool
+        if tool_name == 'Task':
+            task_prompt = tool_input.get('prompt', '')
+            task_entity = {
                 'id': tool_use_id,
-                'block_id': block_id,
-                'message_id': message_id,
-                'tool_name': tool_name,
-                'input': tool_input,
+                'tool_use_id': tool_use_id,
+                'description': tool_input.get('description', ''),
+                'prompt': task_prompt,
+                'subagent_type': _intern_str(tool_input.get('subagent_type', '')),
             }
 
-            # Apply deduplication if request_id available
+            # Apply deduplication
             if request_id is not None:
-                tool_use_entity = self.deduplicator.deduplicate_entity(
-                    tool_use_entity, 'tool_use', request_id
+                task_entity = self.deduplicator.deduplicate_entity(
+                    task_entity, 'task', request_id
                 )
 
-                # Track tool use in agent tracker (for workflow DAG)
-                # Get timestamp from request
-                timestamp = ""
-                if request_id < len(self.api_requests):
-                    timestamp = self.api_requests[request_id].get('timestamp', '')
-                self.agent_tracker.track_tool_use(request_id, block, timestamp)
-
-            self.tool_uses.append(tool_use_entity)
-
-            # Special handling for Task tool
-            if tool_name == 'Task':
-                task_prompt = tool_input.get('prompt', '')
-                task_entity = {
-                    'id': tool_use_id,
-                    'tool_use_id': tool_use_id,
-                    'description': tool_input.get('description', ''),
-                    'prompt': task_prompt,
-                    'subagent_type': tool_input.get('subagent_type', ''),
-                }
-
-                # Apply deduplication
-                if request_id is not None:
-                    task_entity = self.deduplicator.deduplicate_entity(
-                        task_entity, 'task', request_id
-                    )
-
-                    # Register task prompt for subagent matching (only for first occurrence)
-                    if not task_entity.get('is_duplicate'):
-                        agent_id = self.agent_tracker.request_to_agent.get(request_id)
-                        if agent_id and task_prompt:
-                            self.agent_tracker.register_task_prompt(tool_use_id, task_prompt, agent_id)
-
-                self.tasks.append(task_entity)
-
-        elif block_type == 'tool_result':
-            tool_use_id = block.get('tool_use_id')
-            result_content = block.get('content')
+                # Register task prompt for subagent matching (only for first occurrence)
+                if not task_entity.get('is_duplicate'):
+                    agent_id = self.agent_tracker.request_to_agent.get(request_id)
+                    if agent_id and task_prompt:
+                        self.agent_tracker.register_task_prompt(tool_use_id, task_prompt, agent_id)
 
-            block_entity['tool_use_id'] = tool_use_id
-            block_entity['result_content'] = result_content
+            self.tasks.append(task_entity)
 
-            # Create tool result entity
-            tool_result_entity = {
-                'id': f'result_{len(self.tool_results)}',
-                'block_id': block_id,
-                'message_id': message_id,
-                'tool_use_id': tool_use_id,
-                'content': result_content,
-            }
-            self.tool_results.append(tool_result_entity)
-            self.tool_use_to_result[tool_use_id] = len(self.tool_results) - 1
+    def _extract_tool_result_block(self, block: Dict, block_entity: Dict, block_id: str,
+                                   message_id: str, request_id: int = None, timestamp: str = ""):
+        """Fill in a tool_result block and record the tool result entity."""
+        tool_use_id = block.get('tool_use_id')
+        result_content = block.get('content')
 
-            # Track tool result in agent tracker (for workflow DAG)
-            if request_id is not None:
-                timestamp = ""
-                if request_id < len(self.api_requests):
-                    timestamp = self.api_requests[request_id].get('timestamp', '')
-                self.agent_tracker.track_tool_result(request_id, block, timestamp)
-
-            # Extract agent ID from Task tool results
-            if isinstance(result_content, list):
-                for item in result_content:
-                    if isinstance(item, dict) and item.get('type') == 'text':
-                        text = item.get('text', '')
-                        if 'agentId:' in text:
-                            # Extract agent ID
-                            import re
-                            match = re.search(r'agentId:\s*([a-f0-9]+)', text)
-                            if match:
-                                agent_id = match.group(1)
-                                self.task_to_agent[tool_use_id] = agent_id
-                                if agent_id not in self.agents:
-                                    self.agents[agent_id] = {
-                                        'id': agent_id,
-                                        'task_tool_use_id': tool_use_id,
-                                        'first_seen': message_id,
-                                    }
+        block_entity['tool_use_id'] = tool_use_id
+        block_entity['result_content'] = result_content
 
-        self.content_blocks.append(block_entity)
-        return block_id
+        # Create tool result entity
+        tool_result_entity = {
+            'id': f'result_{len(self.tool_results)}',
+            'block_id': block_id,
+            'message_id': message_id,
+            'tool_use_id': tool_use_id,
+            'content': result_content,
+        }
+        self.tool_results.append(tool_result_entity)
+        self.tool_use_to_result[tool_use_id] = len(self.tool_results) - 1
+
+        # Track tool result in agent tracker (for workflow DAG)
+        if request_id is not None:
+            self.agent_tracker.track_tool_result(request_id, block, timestamp)
+
+        # Extract agent ID from Task tool results
+        if isinstance(result_content, list):
+            for item in result_content:
+                if isinstance(item, dict) and item.get('type') == 'text':
+                    text = item.get('text', '')
+                    marker_pos = text.find('agentId:')
+                    if marker_pos != -1:
+                        # Extract agent ID (the regex scan starts at the marker)
+                        match = _RE_AGENT_ID.search(text, marker_pos)
+                        if match:
+                            agent_id = match.group(1)
+                            self.task_to_agent[tool_use_id] = agent_id
+                            if agent_id not in self.agents:
+                                self.agents[agent_id] = {
+                                    'id': agent_id,
+                                    'task_tool_use_id': tool_use_id,
+                                    'first_seen': message_id,
+                                }
 
     def extract_response(self, response: Dict, request_id: int, timestamp: str) -> Dict:
         """Extract response entity and its content."""
@@ -363,7 +460,7 @@ class EntityExtractor:
 
             for block_idx, item in enumerate(body['content']):
                 if isinstance(item, dict):
-                    block_id = self.extract_content_block(item, message_id, block_idx, request_id)
+                    block_id = self.extract_content_block(item, message_id, block_idx, request_id, timestamp)
                     message_entity['content_blocks'].append(block_id)
 
             self.messages.append(message_entity)
@@ -398,19 +495,13 @@ class EntityExtractor:
 
     def get_tool_usage_stats(self) -> Dict[str, int]:
         """Get statistics on tool usage."""
-        tool_counts = defaultdict(int)
-        for tool_use in self.tool_uses:
-            tool_name = tool_use.get('tool_name') or 'unknown'
-            tool_counts[tool_name] += 1
-        return dict(sorted(tool_counts.items(), key=lambda x: x[1], reverse=True))
+        tool_counts = Counter(tool_use.get('tool_name') or 'unknown' for tool_use in self.tool_uses)
+        return dict(tool_counts.most_common())
 
     def get_task_type_stats(self) -> Dict[str, int]:
         """Get statistics on task subagent types."""
-        type_counts = defaultdict(int)
-        for task in self.tasks:
-            subagent_type = task.get('subagent_type', 'unknown')
-            type_counts[subagent_type] += 1
-        return dict(sorted(type_counts.items(), key=lambda x: x[1], reverse=True))
+        type_counts = Counter(task.get('subagent_type', 'unknown') for task in self.tasks)
+        return dict(type_counts.most_common())
 
     def export_to_json(self, output_path: Path):
         """Export all entities to JSON file."""
@@ -445,8 +536,12 @@ class EntityExtractor:
             'workflow_dag': workflow_dag,
         }
 
-        with open(output_path, 'w') as f:
-            json.dump(data, f, indent=2)
+        if orjson is not None:
+            with open(output_path, 'wb') as f:
+                _write_json_streamed(f, data)
+        else:
+            with open(output_path, 'w') as f:
+                json.dump(data, f, indent=2)
 
         print(f"\nExported all entities to {output_path}")
 
@@ -520,6 +615,11 @@ def main():
         default=None,
         help='Output JSON file (default: entities_extracted.json)'
     )
+    parser.add_argument(
+        '--keep-body',
+        action='store_true',
+        help='Keep full request bodies (messages/system/tools) on api_requests'
+    )
 
     args = parser.parse_args()
 
@@ -530,7 +630,7 @@ def main():
     output_path = args.output or args.log_file.parent / 'entities_extracted.json'
 
     # Extract entities
-    extractor = EntityExtractor()
+    extractor = EntityExtractor(keep_body=args.keep_body)
     extractor.extract_from_log_file(args.log_file)
 
     # Print summary
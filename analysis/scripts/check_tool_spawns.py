@@ -16,26 +16,26 @@ def main():
     print(f'Total edges: {len(edges)}')
     print()
     
-    # Count by type
-    edge_types = Counter(e['type'] for e in edges)
+    # Count by type and group subagent_spawn edges by spawn_method in one pass
+    edge_types = Counter()
+    spawn_by_method = {}
+    spawn_count = 0
+    for e in edges:
+        edge_type = e['type']
+        edge_types[edge_type] += 1
+        if edge_type == 'subagent_spawn':
+            spawn_count += 1
+            spawn_by_method.setdefault(e.get('spawn_method', 'unknown'), []).append(e)
+
     print('Edge counts by type:')
     for edge_type, count in sorted(edge_types.items()):
         print(f'  {edge_type}: {count}')
     print()
     
     # Show subagent_spawn edges
-    spawn_edges = [e for e in edges if e['type'] == 'subagent_spawn']
-    print(f'Subagent spawn edges: {len(spawn_edges)}')
+    print(f'Subagent spawn edges: {spawn_count}')
     print()
     
-    # Group by spawn_method
-    spawn_by_method = {}
-    for e in spawn_edges:
-        method = e.get('spawn_method', 'unknown')
-        if method not in spawn_by_method:
-            spawn_by_method[method] = []
-        spawn_by_method[method].append(e)
-    
     for method, edges_list in sorted(spawn_by_method.items()):
         print(f'{method} spawns: {len(edges_list)}')
         for e in edges_list:
@@ -55,7 +55,7 @@ def main():
     print()
     
     print(f'Total child agents: {len(child_agents)}')
-    print(f'Total root agents: {len([a for a in agents if not a.get("parent_agent_id")])}')
+    print(f'Total root agents: {len(agents) - len(child_agents)}')
 
 if __name__ == '__main__':
     main()
@@ -3,19 +3,27 @@
 Simple API server to serve log files to the viewer.
 """
 
+import hashlib
+import heapq
 import json
 import os
-import pickle
 import logging
+import threading
 from pathlib import Path
 from datetime import datetime
 
-from flask import Flask, jsonify
+from flask import Flask, Response, jsonify, request
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from dotenv import load_dotenv
 from log_classifier import enrich_logs_only
 from workflow_graph import build_workflow_graph
 
+try:
+    import orjson
+except ImportError:  # optional speedup, falls back to stdlib json
+    orjson = None
+
 load_dotenv()
 
 # Configure logging
@@ -26,69 +34,283 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+class ORJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson, so every jsonify call uses it."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(
+            obj, default=self.default, option=orjson.OPT_NON_STR_KEYS
+        ).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 app = Flask(__name__)
+if orjson is not None:
+    app.json = ORJSONProvider(app)
 CORS(app)
 
 LOG_DIR = Path(os.getenv("LOG_DIR", "./logs"))
 API_PORT = int(os.getenv("API_PORT", "58736"))
-CACHE_FILE = LOG_DIR / ".enriched_cache.pkl"
+CACHE_FILE = LOG_DIR / ".enriched_cache.json"
 
 # Cache for enriched data
 _cache = {
     'logs': None,
     'enriched_data': None,
-    'last_modified': None
+    'log_state': None,
+    'workflow_state': None,
+    # Bytes consumed per log file, so appended lines can be enriched on their own
+    'file_offsets': None
 }
 
-# Flag to prevent concurrent cache building
-_cache_building = False
+# Held while the workflow graph is built; other requests block on it (with a
+# timeout) instead of building concurrently
+_cache_build_lock = threading.Lock()
+CACHE_BUILD_TIMEOUT = 60
+
+
+def _scan_log_dir(prefix, suffix):
+    """List matching files in LOG_DIR, newest first, as DirEntry objects with cached stat."""
+    with os.scandir(LOG_DIR) as it:
+        entries = [
+            e for e in it
+            if e.name.startswith(prefix) and e.name.endswith(suffix) and e.is_file()
+        ]
+    entries.sort(key=lambda e: e.stat().st_mtime, reverse=True)
+    return entries
+
+
+def _log_timestamp(entry):
+    return entry.get('timestamp', '')
+
+
+def _read_log_file(path, offset, loads):
+    """
+    Parse JSONL entries from path starting at byte offset.
+
+    Returns (entries, offset) where offset is the end of the last line consumed.
+    A trailing line that is not newline-terminated and does not parse yet is
+    left for the next read, since the proxy may still be writing it.
+    """
+    entries = []
+    with open(path, 'rb') as f:
+        if offset:
+            f.seek(offset)
+        for line in f:
+            stripped = line.strip()
+            if stripped:
+                try:
+                    entries.append(loads(stripped))
+                except json.JSONDecodeError:
+                    if not line.endswith(b'\n'):
+                        break
+            offset += len(line)
+    return entries, offset
+
+
+def _read_log_files(offsets):
+    """
+    Read every log file from its offset in `offsets` (0 for files not listed).
+
+    Returns (per_file, new_offsets): one timestamp-sorted entry list per file,
+    newest file first, and the offsets consumed. Returns None if a file listed
+    in `offsets` has been removed or truncated, as the offsets are then stale.
+    """
+    if not LOG_DIR.exists():
+        return None if offsets else ([], {})
+
+    # Get all .jsonl files sorted by modification time (newest first)
+    log_files = _scan_log_dir('', '.jsonl')
+
+    if offsets:
+        sizes = {e.path: e.stat().st_size for e in log_files}
+        for path, offset in offsets.items():
+            if sizes.get(path, -1) < offset:
+                return None
+
+    # orjson parses bytes lines directly (its JSONDecodeError subclasses json's)
+    loads = orjson.loads if orjson is not None else json.loads
+
+    per_file = []
+    new_offsets = {}
+    for log_file in log_files:
+        offset = offsets.get(log_file.path, 0)
+        try:
+            entries, offset = _read_log_file(log_file.path, offset, loads)
+        except Exception as e:
+            print(f"Error reading {log_file.path}: {e}")
+            entries = []
+        entries.sort(key=_log_timestamp)
+        per_file.append(entries)
+        new_offsets[log_file.path] = offset
+
+    return per_file, new_offsets
+
+
+def iter_all_logs():
+    """
+    Yield entries from all JSONL log files, oldest timestamp first.
+
+    Each file is sorted on its own (a linear pass for the usual append-only,
+    already time-ordered file) and the files are combined with heapq.merge,
+    which keeps ties in file order just like a stable sort of the whole list.
+    """
+    per_file, _ = _read_log_files({})
+    # Oldest first for workflow graph processing; frontend can reverse for display
+    yield from heapq.merge(*per_file, key=_log_timestamp)
 
 
 def read_all_logs():
     """Read all JSONL log files and return as list."""
-    logs = []
-    
+    return list(iter_all_logs())
+
+
+def refresh_enriched_logs(log_state):
+    """
+    Return enriched logs matching log_state, updating the memory cache.
+
+    Log files are append-only, so when the cache holds file offsets only the
+    appended lines are parsed and enriched. If the new entries would not sort
+    strictly after the cached ones (or a file shrank or vanished), everything
+    is re-read so the result matches a full rebuild.
+    """
+    cached_logs = _cache['logs']
+    if cached_logs is not None and log_state is not None and log_state == _cache['log_state']:
+        logger.info(f"Using cached enriched logs: {len(cached_logs)} logs")
+        return cached_logs
+
+    if cached_logs is not None and _cache['file_offsets'] is not None:
+        result = _read_log_files(_cache['file_offsets'])
+        if result is not None:
+            per_file, offsets = result
+            new_logs = list(heapq.merge(*per_file, key=_log_timestamp))
+            if (not new_logs or not cached_logs or
+                    _log_timestamp(new_logs[0]) > _log_timestamp(cached_logs[-1])):
+                # New list: the cached workflow graph and encoded bodies key on identity
+                enriched_logs = cached_logs
+                if new_logs:
+                    enriched_logs = cached_logs + enrich_logs_only(new_logs, start=len(cached_logs))
+                logger.info(f"Enriched {len(new_logs)} appended logs ({len(enriched_logs)} total)")
+                _cache['logs'] = enriched_logs
+                _cache['log_state'] = log_state
+                _cache['file_offsets'] = offsets
+                return enriched_logs
+            logger.info("Appended logs sort before cached ones, re-reading all logs")
+        else:
+            logger.info("Log files were truncated or removed, re-reading all logs")
+
+    per_file, offsets = _read_log_files({})
+    enriched_logs = enrich_logs_only(heapq.merge(*per_file, key=_log_timestamp))
+    logger.info(f"Enriched {len(enriched_logs)} logs with metadata")
+    _cache['logs'] = enriched_logs
+    _cache['log_state'] = log_state
+    _cache['file_offsets'] = offsets
+    return enriched_logs
+
+
+def _dumps_json(payload):
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload).encode('utf-8')
+
+
+def json_response(payload):
+    """Serialize a large payload, using orjson when available instead of jsonify."""
+    return Response(_dumps_json(payload), mimetype='application/json')
+
+
+def _not_modified(etag):
+    """Return a 304 response if the client's If-None-Match covers etag, else None."""
+    if not request.if_none_match.contains_weak(etag):
+        return None
+    response = Response(status=304)
+    response.set_etag(etag)
+    return response
+
+
+# Encoded response bodies by name, as (source object, bytes, etag)
+_json_cache = {}
+
+
+def cached_json_response(name, source, payload=None):
+    """
+    Like json_response, but reuse the encoded body until `source` is replaced.
+
+    `source` is the cached object the payload is built from (`payload` defaults
+    to it). The memory cache always swaps in new objects instead of mutating
+    them, so an identity check is enough to tell the body is stale. The body
+    carries an ETag, and clients that already have it get a 304.
+    """
+    cached = _json_cache.get(name)
+    if cached is None or cached[0] is not source:
+        body = _dumps_json(source if payload is None else payload)
+        cached = (source, body, hashlib.blake2b(body, digest_size=16).hexdigest())
+        _json_cache[name] = cached
+
+    not_modified = _not_modified(cached[2])
+    if not_modified is not None:
+        return not_modified
+    response = Response(cached[1], mimetype='application/json')
+    response.set_etag(cached[2])
+    return response
+
+
+def count_log_lines():
+    """
+    Count lines across all log files without parsing them.
+
+    Each proxy-written line is one entry, so this matches the entry count
+    except for blank or malformed lines.
+    """
     if not LOG_DIR.exists():
-        return logs
-    
-    # Get all .jsonl files sorted by modification time (newest first)
-    log_files = sorted(
-        LOG_DIR.glob("*.jsonl"),
-        key=lambda p: p.stat().st_mtime,
-        reverse=True
-    )
-    
-    for log_file in log_files:
+        return 0
+
+    count = 0
+    for log_file in _scan_log_dir('', '.jsonl'):
         try:
-            with open(log_file, 'r') as f:
-                for line in f:
-                    line = line.strip()
-                    if line:
-                        try:
-                            logs.append(json.loads(line))
-                        except json.JSONDecodeError:
-                            continue
-        except Exception as e:
-            print(f"Error reading {log_file}: {e}")
-            continue
-    
-    # Sort by timestamp (oldest first for workflow graph processing)
-    # Frontend can reverse if needed for display
-    logs.sort(key=lambda x: x.get('timestamp', ''))
-    
-    return logs
-
-
-def get_latest_log_mtime():
-    """Get the latest modification time of all log files."""
+            with open(log_file.path, 'rb') as f:
+                last = b''
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    count += block.count(b'\n')
+                    last = block
+                # An unterminated final line still holds an entry
+                if last and not last.endswith(b'\n'):
+                    count += 1
+        except OSError as e:
+            logger.error(f"Error counting lines in {log_file.path}: {e}")
+    return count
+
+
+def get_log_state():
+    """
+    Get a cheap freshness signal for the log files.
+
+    Returns (file count, latest mtime, total size) from a single directory
+    scan, or None if there are no log files. Appends, new files and deleted
+    files all change the tuple, so caches compare it for equality.
+    """
     if not LOG_DIR.exists():
         return None
 
-    log_files = list(LOG_DIR.glob("*.jsonl"))
-    if not log_files:
+    count = 0
+    latest_mtime = 0.0
+    total_size = 0
+    with os.scandir(LOG_DIR) as it:
+        for entry in it:
+            if entry.name.endswith('.jsonl') and entry.is_file():
+                st = entry.stat()
+                count += 1
+                total_size += st.st_size
+                if st.st_mtime > latest_mtime:
+                    latest_mtime = st.st_mtime
+
+    if not count:
         return None
 
-    return max(f.stat().st_mtime for f in log_files)
+    return (count, latest_mtime, total_size)
 
 
 def load_cache_from_disk():
@@ -98,9 +320,15 @@ def load_cache_from_disk():
 
     try:
         with open(CACHE_FILE, 'rb') as f:
-            cached = pickle.load(f)
-            logger.info(f"Loaded cache from disk: {len(cached.get('logs', []))} logs")
-            return cached
+            data = f.read()
+        cached = orjson.loads(data) if orjson is not None else json.loads(data)
+        # The logs list is stored once and shared, as it is in the memory cache
+        cached['enriched_data'] = {
+            'logs': cached['logs'],
+            'workflow_graph': cached.pop('workflow_graph')
+        }
+        logger.info(f"Loaded cache from disk: {len(cached['logs'])} logs")
+        return cached
     except Exception as e:
         logger.error(f"Failed to load cache: {e}")
         return None
@@ -108,9 +336,20 @@ def load_cache_from_disk():
 
 def save_cache_to_disk(cache_data):
     """Save enriched data cache to disk."""
+    # enriched_data['logs'] is the same list as cache_data['logs']; write it once
+    payload = {
+        'logs': cache_data['logs'],
+        'workflow_graph': cache_data['enriched_data']['workflow_graph'],
+        'log_state': cache_data['log_state'],
+        'file_offsets': cache_data['file_offsets']
+    }
     try:
+        if orjson is not None:
+            data = orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+        else:
+            data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
         with open(CACHE_FILE, 'wb') as f:
-            pickle.dump(cache_data, f)
+            f.write(data)
         logger.info(f"Saved cache to disk: {CACHE_FILE}")
     except Exception as e:
         logger.error(f"Failed to save cache: {e}")
@@ -119,102 +358,69 @@ def save_cache_to_disk(cache_data):
 @app.route('/api/logs')
 def get_logs():
     """Return all logs with basic enrichment (agent type, tool info) but no workflow graph."""
-    latest_mtime = get_latest_log_mtime()
-
-    # Try memory cache first
-    if (_cache['logs'] is not None and
-        _cache['last_modified'] is not None and
-        latest_mtime is not None and
-        latest_mtime <= _cache['last_modified']):
-        logger.info("Using memory cache for enriched logs")
-        return jsonify({'logs': _cache['logs']})
-
-    # Read logs from disk
-    logger.info("Reading and enriching logs...")
-    raw_logs = read_all_logs()
-    logger.info(f"Read {len(raw_logs)} logs")
+    log_state = get_log_state()
 
     # Enrich logs with metadata (agent type, tool info, etc.) - NO workflow graph
-    enriched_logs = enrich_logs_only(raw_logs)
-    logger.info(f"Enriched {len(enriched_logs)} logs with metadata")
-
-    # Update memory cache
-    _cache['logs'] = enriched_logs
-    _cache['last_modified'] = latest_mtime
-    logger.info("Memory cache updated with enriched logs")
+    enriched_logs = refresh_enriched_logs(log_state)
 
-    return jsonify({'logs': enriched_logs})
+    return cached_json_response('logs', enriched_logs, {'logs': enriched_logs})
 
 
 @app.route('/api/workflow')
 def get_workflow():
     """Return workflow graph with enriched metadata (expensive, on-demand only)."""
-    global _cache_building
-
-    # If cache is being built, wait and return cached result
-    if _cache_building:
-        import time
+    # If cache is being built, wait for it instead of building concurrently
+    if _cache_build_lock.locked():
         logger.info("Workflow graph is being built, waiting...")
-        # Wait for cache to be ready (check every 0.5 seconds for up to 60 seconds)
-        for _ in range(120):
-            time.sleep(0.5)
-            if not _cache_building:
-                if _cache['enriched_data'] is not None:
-                    logger.info("Workflow graph ready, returning cached data")
-                    return jsonify(_cache['enriched_data'])
-                else:
-                    # Cache building failed, break and try again
-                    break
-
-        # If still building after timeout, return error
-        if _cache_building:
-            logger.error("Workflow graph building timeout")
-            return jsonify({'error': 'Workflow graph building timeout'}), 503
-
-    latest_mtime = get_latest_log_mtime()
+    if not _cache_build_lock.acquire(timeout=CACHE_BUILD_TIMEOUT):
+        logger.error("Workflow graph building timeout")
+        return jsonify({'error': 'Workflow graph building timeout'}), 503
+
+    try:
+        return _get_workflow_locked()
+    finally:
+        _cache_build_lock.release()
+
+
+def _get_workflow_locked():
+    """Serve /api/workflow from cache or rebuild it; caller holds _cache_build_lock."""
+    log_state = get_log_state()
 
     # Try memory cache first
     if (_cache['enriched_data'] is not None and
-        _cache['last_modified'] is not None and
-        latest_mtime is not None and
-        latest_mtime <= _cache['last_modified']):
+        log_state is not None and
+        log_state == _cache['workflow_state']):
         logger.info("Using memory cache for workflow graph")
-        return jsonify(_cache['enriched_data'])
+        return cached_json_response('workflow', _cache['enriched_data'])
 
     # Try disk cache
-    if latest_mtime is not None and CACHE_FILE.exists():
+    if log_state is not None and _cache['enriched_data'] is None and CACHE_FILE.exists():
         disk_cache = load_cache_from_disk()
-        if disk_cache and disk_cache.get('last_modified'):
-            # Check if disk cache is still valid
-            if disk_cache['last_modified'] >= latest_mtime:
+        if disk_cache and disk_cache.get('log_state'):
+            # JSON stores the state tuple as a list
+            disk_state = tuple(disk_cache['log_state'])
+            if disk_state == log_state:
                 _cache['logs'] = disk_cache['logs']
                 _cache['enriched_data'] = disk_cache['enriched_data']
-                _cache['last_modified'] = disk_cache['last_modified']
+                _cache['log_state'] = log_state
+                _cache['workflow_state'] = log_state
+                _cache['file_offsets'] = disk_cache.get('file_offsets')
                 logger.info("Using disk cache for workflow graph")
-                return jsonify(disk_cache['enriched_data'])
-
-    # Set flag to prevent concurrent builds
-    _cache_building = True
+                return cached_json_response('workflow', disk_cache['enriched_data'])
+            if _cache['logs'] is None and disk_cache.get('file_offsets') is not None:
+                # Stale, but its enriched logs only need the appended tail
+                _cache['logs'] = disk_cache['logs']
+                _cache['log_state'] = disk_state
+                _cache['file_offsets'] = disk_cache['file_offsets']
+                logger.info("Disk cache is stale, enriching appended logs only")
 
     try:
         # Recompute
         logger.info("Workflow graph cache miss - building workflow graph...")
 
-        # Use cached enriched logs if available and fresh
-        if (_cache['logs'] is not None and
-            _cache['last_modified'] is not None and
-            latest_mtime is not None and
-            latest_mtime <= _cache['last_modified']):
-            enriched_logs = _cache['logs']
-            logger.info(f"Using cached enriched logs: {len(enriched_logs)} logs")
-        else:
-            # Read and enrich logs
-            raw_logs = read_all_logs()
-            logger.info(f"Read {len(raw_logs)} logs from disk")
-            enriched_logs = enrich_logs_only(raw_logs)
-            logger.info(f"Enriched {len(enriched_logs)} logs with metadata")
-            _cache['logs'] = enriched_logs
-            _cache['last_modified'] = latest_mtime
+        # Reuse cached enriched logs, enriching only what was appended
+        enriched_logs = refresh_enriched_logs(log_state)
+        file_offsets = _cache['file_offsets']
 
         # Build workflow graph (expensive operation)
         logger.info("Building workflow graph...")
@@ -228,23 +434,24 @@ def get_workflow():
 
         # Update memory cache
         _cache['enriched_data'] = enriched_data
+        _cache['workflow_state'] = log_state
         logger.info("Memory cache updated with workflow graph")
 
         # Save to disk
         save_cache_to_disk({
             'logs': enriched_logs,
             'enriched_data': enriched_data,
-            'last_modified': latest_mtime
+            'log_state': log_state,
+            'file_offsets': file_offsets
         })
 
-        return jsonify(enriched_data)
+        return cached_json_response('workflow', enriched_data)
     except Exception as e:
         logger.error(f"ERROR during workflow graph build: {e}", exc_info=True)
         # Clear cache on error so next request will retry
         _cache['enriched_data'] = None
         raise
     finally:
-        _cache_building = False
         logger.info("Workflow graph building complete")
 
 
@@ -252,19 +459,25 @@ def get_workflow():
 def get_entities():
     """Return entities JSON file."""
     # Find the most recent entities file
-    entities_files = sorted(
-        LOG_DIR.glob("entities_*.json"),
-        key=lambda p: p.stat().st_mtime,
-        reverse=True
-    )
+    entities_files = _scan_log_dir('entities_', '.json') if LOG_DIR.exists() else []
 
     if not entities_files:
         return jsonify({"error": "No entities file found"}), 404
 
+    # The file's mtime and size identify its version without reading it
+    st = entities_files[0].stat()
+    etag = f"{st.st_mtime_ns:x}-{st.st_size:x}"
+    not_modified = _not_modified(etag)
+    if not_modified is not None:
+        return not_modified
+
     try:
-        with open(entities_files[0], 'r') as f:
-            entities = json.load(f)
-        return jsonify(entities)
+        with open(entities_files[0].path, 'rb') as f:
+            data = f.read()
+        entities = orjson.loads(data) if orjson is not None else json.loads(data)
+        response = json_response(entities)
+        response.set_etag(etag)
+        return response
     except Exception as e:
         logger.error(f"Failed to load entities: {e}")
         return jsonify({"error": str(e)}), 500
@@ -273,12 +486,11 @@ def get_entities():
 @app.route('/api/health')
 def health():
     """Health check endpoint."""
-    # Use cached data if available
+    # Use cached data if available; otherwise count lines rather than parse
     if _cache['logs'] is not None:
         log_count = len(_cache['logs'])
     else:
-        logs = read_all_logs()
-        log_count = len(logs)
+        log_count = count_log_lines()
 
     graph_nodes = 0
     graph_edges = 0
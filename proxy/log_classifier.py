@@ -4,9 +4,10 @@ Log entry classifier for Claude Code inference logs.
 Enriches log entries with agent type, tool usage, subagent spawns, and other metadata.
 """
 
+import functools
 import hashlib
 import json
-from typing import Dict, List, Any, Optional
+from typing import Dict, Iterable, List, Any, Optional, Tuple
 from workflow_graph import build_workflow_graph
 
 
@@ -57,26 +58,55 @@ AGENT_TYPE_HASHES = {
 }
 
 
+# Shared defaults for lookups in enrich_log_entry; never mutated or returned
+_NO_FIELDS: Dict[str, Any] = {}
+_NO_ITEMS: tuple = ()
+
+# Tool name -> category, for O(1) lookup in categorize_tool
+TOOL_CATEGORIES = {
+    'Read': 'read',
+    'Glob': 'read',
+    'Grep': 'read',
+    'LSP': 'read',
+    'Edit': 'write',
+    'Write': 'write',
+    'Bash': 'execute',
+    'KillShell': 'execute',
+    'Task': 'orchestration',
+    'TodoWrite': 'orchestration',
+    'EnterPlanMode': 'orchestration',
+    'ExitPlanMode': 'orchestration',
+    'AskUserQuestion': 'interaction'
+}
+
+
+@functools.lru_cache(maxsize=1024)
+def _hash_prompt_signature(signature: Tuple[str, ...]) -> str:
+    # MD5 is kept because AGENT_TYPE_HASHES is keyed by its prefixes
+    return hashlib.md5('|||'.join(signature).encode()).hexdigest()
+
+
 def compute_prompt_hash(system_prompts: List[Dict[str, str]]) -> str:
     """Compute hash for system prompt combination (first 200 chars of each)."""
-    signature = []
-    for prompt in system_prompts:
-        text = prompt.get('text', '')
-        signature.append(text[:200])
-    
-    combined = '|||'.join(signature)
-    return hashlib.md5(combined.encode()).hexdigest()
+    # The same few system prompts are resent with every request, so the
+    # MD5 is cached on the truncated texts
+    return _hash_prompt_signature(
+        tuple(prompt.get('text', '')[:200] for prompt in system_prompts)
+    )
 
 
 def classify_agent_type(log_entry: Dict[str, Any]) -> Optional[Dict[str, str]]:
     """Classify the agent type based on system prompts."""
-    system = log_entry.get('body', {}).get('system', [])
+    return _classify_system(log_entry.get('body', {}).get('system', []))
+
+
+def _classify_system(system: List[Dict[str, str]]) -> Optional[Dict[str, str]]:
     if not system:
         return None
-    
+
     prompt_hash = compute_prompt_hash(system)
     hash_prefix = prompt_hash[:8]
-    
+
     return AGENT_TYPE_HASHES.get(hash_prefix, {
         "name": "unknown",
         "label": "Unknown Agent",
@@ -104,67 +134,72 @@ def extract_response_tools(log_entry: Dict[str, Any]) -> List[Dict[str, Any]]:
 
 def categorize_tool(tool_name: str) -> str:
     """Categorize tool by type."""
-    if tool_name in ['Read', 'Glob', 'Grep', 'LSP']:
-        return 'read'
-    elif tool_name in ['Edit', 'Write']:
-        return 'write'
-    elif tool_name in ['Bash', 'KillShell']:
-        return 'execute'
-    elif tool_name in ['Task', 'TodoWrite', 'EnterPlanMode', 'ExitPlanMode']:
-        return 'orchestration'
-    elif tool_name in ['AskUserQuestion']:
-        return 'interaction'
-    else:
-        return 'other'
+    return TOOL_CATEGORIES.get(tool_name, 'other')
 
 
 def extract_tool_info(log_entry: Dict[str, Any]) -> Dict[str, Any]:
     """Extract comprehensive tool usage information."""
-    tools = extract_response_tools(log_entry)
-    
+    response_content = log_entry.get('response', {}).get('body', {}).get('content', [])
+    return _scan_response_tools(response_content)[0]
+
+
+def extract_subagent_spawns(log_entry: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Extract subagent spawn information from Task tool usage."""
+    response_content = log_entry.get('response', {}).get('body', {}).get('content', [])
+    return _scan_response_tools(response_content)[1]
+
+
+def _scan_response_tools(response_content: Any) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """Build tool_info and subagent spawns in a single pass over response content."""
+    tools = []
+    tool_names = []
     tool_counts = {}
     tool_categories = {}
-    
-    for tool in tools:
-        name = tool['name']
-        if name:
+    spawns = []
+
+    if isinstance(response_content, list):
+        for content_block in response_content:
+            if content_block.get('type') != 'tool_use':
+                continue
+            name = content_block.get('name')
+            tool_input = content_block.get('input', {})
+            tools.append({
+                'id': content_block.get('id'),
+                'name': name,
+                'input': tool_input
+            })
+            if not name:
+                continue
+            tool_names.append(name)
             tool_counts[name] = tool_counts.get(name, 0) + 1
-            category = categorize_tool(name)
+            category = TOOL_CATEGORIES.get(name, 'other')
             tool_categories[category] = tool_categories.get(category, 0) + 1
-    
-    return {
+            if name == 'Task':
+                spawns.append({
+                    'subagent_type': tool_input.get('subagent_type'),
+                    'model': tool_input.get('model'),
+                    'description': tool_input.get('description', '')[:100],
+                    'has_resume': 'resume' in tool_input
+                })
+
+    tool_info = {
         'count': len(tools),
         'tools': tools,
-        'tool_names': [t['name'] for t in tools if t['name']],
+        'tool_names': tool_names,
         'tool_counts': tool_counts,
         'categories': tool_categories,
         'has_tools': len(tools) > 0
     }
-
-
-def extract_subagent_spawns(log_entry: Dict[str, Any]) -> List[Dict[str, Any]]:
-    """Extract subagent spawn information from Task tool usage."""
-    spawns = []
-    tools = extract_response_tools(log_entry)
-
-    for tool in tools:
-        if tool['name'] == 'Task':
-            task_input = tool.get('input', {})
-            spawns.append({
-                'subagent_type': task_input.get('subagent_type'),
-                'model': task_input.get('model'),
-                'description': task_input.get('description', '')[:100],
-                'has_resume': 'resume' in task_input
-            })
-
-    return spawns
+    return tool_info, spawns
 
 
 def extract_tool_errors(log_entry: Dict[str, Any]) -> int:
     """Count tool errors in the request messages."""
-    error_count = 0
-    messages = log_entry.get('body', {}).get('messages', [])
+    return _count_tool_errors(log_entry.get('body', {}).get('messages', []))
 
+
+def _count_tool_errors(messages: List[Dict[str, Any]]) -> int:
+    error_count = 0
     for msg in messages:
         if isinstance(msg.get('content'), list):
             for content_block in msg['content']:
@@ -183,7 +218,10 @@ def extract_model_info(log_entry: Dict[str, Any]) -> Dict[str, str]:
     """Extract model information."""
     request_model = log_entry.get('body', {}).get('model', 'unknown')
     response_model = log_entry.get('response', {}).get('body', {}).get('model')
+    return _model_info(request_model, response_model)
+
 
+def _model_info(request_model: str, response_model: Optional[str]) -> Dict[str, str]:
     # Simplify model names
     model = response_model or request_model
     if 'GLM-4.7' in model:
@@ -203,17 +241,20 @@ def enrich_log_entry(log_entry: Dict[str, Any]) -> Dict[str, Any]:
     """Enrich a log entry with all classification metadata."""
     enriched = log_entry.copy()
 
+    # Look up the request and response bodies once for all extractors; missing
+    # or null sections fall back to shared empties instead of fresh {} and []
+    body = log_entry.get('body') or _NO_FIELDS
+    response_body = (log_entry.get('response') or _NO_FIELDS).get('body') or _NO_FIELDS
+
     # Add agent type classification
-    agent_type = classify_agent_type(log_entry)
+    agent_type = _classify_system(body.get('system', _NO_ITEMS))
     if agent_type:
         enriched['agent_type'] = agent_type
 
-    # Add tool information
-    tool_info = extract_tool_info(log_entry)
+    # Add tool and subagent spawn information (one pass over response content)
+    tool_info, subagent_spawns = _scan_response_tools(response_body.get('content', _NO_ITEMS))
     enriched['tool_info'] = tool_info
 
-    # Add subagent spawn information
-    subagent_spawns = extract_subagent_spawns(log_entry)
     if subagent_spawns:
         enriched['subagent_spawns'] = subagent_spawns
         enriched['has_subagent_spawns'] = True
@@ -223,32 +264,36 @@ def enrich_log_entry(log_entry: Dict[str, Any]) -> Dict[str, Any]:
         enriched['subagent_count'] = 0
 
     # Add error information
-    tool_errors = extract_tool_errors(log_entry)
+    tool_errors = _count_tool_errors(body.get('messages', _NO_ITEMS))
     enriched['tool_errors'] = tool_errors
     enriched['has_errors'] = tool_errors > 0
 
     # Add stop reason
-    stop_reason = extract_stop_reason(log_entry)
+    stop_reason = response_body.get('stop_reason')
     if stop_reason:
         enriched['stop_reason'] = stop_reason
 
     # Add model info
-    model_info = extract_model_info(log_entry)
-    enriched['model_info'] = model_info
+    enriched['model_info'] = _model_info(body.get('model', 'unknown'), response_body.get('model'))
 
     return enriched
 
 
-def enrich_logs_only(logs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def enrich_logs_only(logs: Iterable[Dict[str, Any]], start: int = 0) -> List[Dict[str, Any]]:
     """
     Enrich all log entries with metadata (agent type, tool info, etc.).
-    Does NOT build workflow graph.
+    Does NOT build workflow graph. Accepts any iterable, so entries can be
+    streamed straight from the log reader.
+
+    Args:
+        logs: Log entries in order
+        start: log_index of the first entry, when enriching appended entries
 
     Returns:
         List of enriched log entries with log_index added
     """
     enriched = []
-    for idx, log in enumerate(logs):
+    for idx, log in enumerate(logs, start):
         enriched_log = enrich_log_entry(log)
         enriched_log['log_index'] = idx
         enriched.append(enriched_log)
@@ -4,10 +4,14 @@ Logging proxy server for Claude Code inference requests.
 Forwards requests to the actual endpoint while logging all communication.
 """
 
+import atexit
 import json
 import os
+import queue
 import sys
+import threading
 from datetime import datetime
+from http.cookiejar import DefaultCookiePolicy
 from pathlib import Path
 from typing import Any
 
@@ -15,6 +19,14 @@ from dotenv import load_dotenv
 from flask import Flask, Response, request
 import requests
 
+try:
+    import orjson
+except ImportError:  # optional speedup, falls back to stdlib json
+    orjson = None
+
+# orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers catch the latter
+_json_loads = orjson.loads if orjson is not None else json.loads
+
 load_dotenv()
 
 app = Flask(__name__)
@@ -23,9 +35,16 @@ UPSTREAM_URL = os.getenv("UPSTREAM_URL", "").rstrip("/")
 LOG_DIR = Path(os.getenv("LOG_DIR", "./logs"))
 PROXY_PORT = int(os.getenv("PROXY_PORT", "58734"))
 REDACT_KEYS = {"authorization", "api-key", "x-api-key", "cookie"}
+# Enough bytes for the 1000-character raw preview logged when SSE parsing fails
+RAW_PREVIEW_BYTES = 4000
 
 LOG_DIR.mkdir(exist_ok=True)
 
+# Shared session so upstream connections are kept alive and reused across
+# requests. Cookies are refused so one client's Set-Cookie never leaks to another.
+upstream_session = requests.Session()
+upstream_session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
 
 def redact_headers(headers: dict) -> dict:
     """Remove sensitive headers from logging."""
@@ -40,10 +59,66 @@ def get_log_filename() -> Path:
     return LOG_DIR / f"requests_{datetime.now().strftime('%Y%m%d')}.jsonl"
 
 
+def _dumps_log_line(entry: dict) -> bytes:
+    if orjson is not None:
+        try:
+            return orjson.dumps(entry) + b"\n"
+        except TypeError:  # orjson.JSONEncodeError, e.g. integers beyond 64 bits
+            pass
+    return (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+# Entries are appended by a background writer so request threads never wait on
+# disk. Each queued item is (log file, entry); None stops the writer.
+_log_queue: queue.Queue = queue.Queue()
+LOG_BATCH_SIZE = 64
+
+
 def log_entry(entry: dict) -> None:
-    """Append log entry to JSONL file."""
-    with open(get_log_filename(), "a") as f:
-        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    """Queue log entry for appending to the JSONL file."""
+    # The file is picked now so entries land in the file for their own date
+    _log_queue.put((get_log_filename(), entry))
+
+
+def _log_writer() -> None:
+    """Append queued entries, writing whatever has accumulated in one go per file."""
+    running = True
+    while running:
+        batch = [_log_queue.get()]
+        try:
+            while len(batch) < LOG_BATCH_SIZE:
+                batch.append(_log_queue.get_nowait())
+        except queue.Empty:
+            pass
+
+        lines_by_file: dict[Path, list[bytes]] = {}
+        for item in batch:
+            if item is None:
+                running = False
+                continue
+            path, entry = item
+            try:
+                lines_by_file.setdefault(path, []).append(_dumps_log_line(entry))
+            except Exception as e:
+                print(f"Failed to serialize log entry: {e}", file=sys.stderr)
+
+        for path, lines in lines_by_file.items():
+            try:
+                with open(path, "ab") as f:
+                    f.write(b"".join(lines))
+            except OSError as e:
+                print(f"Failed to write {path}: {e}", file=sys.stderr)
+
+
+def _stop_log_writer() -> None:
+    """Flush queued entries on shutdown."""
+    _log_queue.put(None)
+    _log_writer_thread.join(timeout=5)
+
+
+_log_writer_thread = threading.Thread(target=_log_writer, name="log-writer", daemon=True)
+_log_writer_thread.start()
+atexit.register(_stop_log_writer)
 
 
 def parse_sse_stream(stream_data: str, format_hint: str = "auto") -> dict[str, Any]:
@@ -58,114 +133,195 @@ def parse_sse_stream(stream_data: str, format_hint: str = "auto") -> dict[str, A
 
     Returns a dict with the aggregated message content and metadata.
     """
-    lines = stream_data.strip().split('\n')
+    parser = SSEParser(format_hint)
+    parser.feed_lines(stream_data.split('\n'))
+    return parser.close()
+
+
+class SSEParser:
+    """
+    Incremental Server-Sent Events parser.
+
+    Chunks are fed as they arrive from upstream and each complete line is
+    handled immediately, so the stream never has to be joined and split.
+    Gives the same result as parse_sse_stream on the whole body.
+    """
+
+    # Lines inspected for an "event: " prefix when auto-detecting the format
+    DETECT_LINES = 20
+
+    def __init__(self, format_hint: str = "auto"):
+        self._buffer = bytearray()
+        self._head: list[str] = []
+        self._stream = None
+        if format_hint != "auto":
+            self._stream = _select_stream(format_hint)
+
+    def feed(self, chunk: bytes) -> None:
+        """Consume a chunk of the raw stream."""
+        self._buffer += chunk
+        end = self._buffer.rfind(b'\n')
+        if end < 0:
+            return
+        lines = self._buffer[:end].split(b'\n')
+        del self._buffer[:end + 1]
+        self.feed_lines(line.decode("utf-8", errors="replace") for line in lines)
+
+    def feed_lines(self, lines) -> None:
+        """Consume already-decoded lines of the stream."""
+        for line in lines:
+            self._feed_line(line)
+
+    def close(self) -> dict[str, Any]:
+        """Flush the last unterminated line and return the aggregated message."""
+        if self._buffer:
+            self._feed_line(self._buffer.decode("utf-8", errors="replace"))
+            self._buffer.clear()
+        if self._stream is None:
+            # Short stream without any "event: " line
+            self._start(_OpenAIStream())
+        return self._stream.result()
+
+    def _feed_line(self, line: str) -> None:
+        if self._stream is not None:
+            self._stream.feed_line(line)
+            return
+
+        # Leading whitespace of the stream is ignored, like stream_data.strip()
+        if not self._head:
+            line = line.lstrip()
+            if not line:
+                return
+        self._head.append(line)
 
-    # Detect format if auto
-    if format_hint == "auto":
         # Anthropic uses "event: " prefix, OpenAI doesn't
-        has_event_prefix = any(line.startswith('event: ') for line in lines[:20])
-        format_hint = "anthropic" if has_event_prefix else "openai"
+        if line.startswith('event: '):
+            self._start(_AnthropicStream())
+        elif len(self._head) >= self.DETECT_LINES:
+            self._start(_OpenAIStream())
+
+    def _start(self, stream) -> None:
+        self._stream = stream
+        for line in self._head:
+            stream.feed_line(line)
+        self._head = []
 
-    if format_hint == "openai":
-        return _parse_openai_sse_stream(lines)
-    else:
-        return _parse_anthropic_sse_stream(lines)
+
+def _select_stream(format_hint: str):
+    return _OpenAIStream() if format_hint == "openai" else _AnthropicStream()
 
 
 def _parse_anthropic_sse_stream(lines: list[str]) -> dict[str, Any]:
     """Parse Anthropic-format SSE stream (event: + data: format)."""
-    message_data = {
-        "id": None,
-        "type": "message",
-        "role": "assistant",
-        "content": [],
-        "model": None,
-        "stop_reason": None,
-        "stop_sequence": None,
-        "usage": None
-    }
+    stream = _AnthropicStream()
+    for line in lines:
+        stream.feed_line(line)
+    return stream.result()
 
-    current_content_block = None
-    current_event = None
-    current_data = ""
 
+def _parse_openai_sse_stream(lines: list[str]) -> dict[str, Any]:
+    """Parse OpenAI-format SSE stream (data: only, ends with data: [DONE])."""
+    stream = _OpenAIStream()
     for line in lines:
+        stream.feed_line(line)
+    return stream.result()
+
+
+class _AnthropicStream:
+    """Line-at-a-time aggregation of an Anthropic-format SSE stream."""
+
+    def __init__(self):
+        self.message_data = {
+            "id": None,
+            "type": "message",
+            "role": "assistant",
+            "content": [],
+            "model": None,
+            "stop_reason": None,
+            "stop_sequence": None,
+            "usage": None
+        }
+        self.current_content_block = None
+        self.current_event = None
+
+    def feed_line(self, line: str) -> None:
         line = line.strip()
 
         if line.startswith('event: '):
-            current_event = line[7:]
-            current_data = ""
+            self.current_event = line[7:]
         elif line.startswith('data: '):
-            current_data = line[6:]
-
             try:
-                data = json.loads(current_data)
-
-                if current_event == 'message_start':
-                    msg = data.get('message', {})
-                    message_data['id'] = msg.get('id')
-                    message_data['model'] = msg.get('model')
-                    message_data['role'] = msg.get('role', 'assistant')
-                    message_data['usage'] = msg.get('usage')
-
-                elif current_event == 'content_block_start':
-                    block = data.get('content_block', {})
-                    current_content_block = {
-                        'type': block.get('type'),
-                        'text': '' if block.get('type') == 'text' else None
-                    }
-                    if block.get('type') == 'thinking':
-                        current_content_block['thinking'] = ''
-
-                elif current_event == 'content_block_delta':
-                    delta = data.get('delta', {})
-                    if current_content_block:
-                        if delta.get('type') == 'text_delta':
-                            current_content_block['text'] += delta.get('text', '')
-                        elif delta.get('type') == 'thinking_delta':
-                            current_content_block['thinking'] += delta.get('thinking', '')
-
-                elif current_event == 'content_block_stop':
-                    if current_content_block:
-                        message_data['content'].append(current_content_block)
-                        current_content_block = None
-
-                elif current_event == 'message_delta':
-                    delta = data.get('delta', {})
-                    if 'stop_reason' in delta:
-                        message_data['stop_reason'] = delta['stop_reason']
-                    if 'stop_sequence' in delta:
-                        message_data['stop_sequence'] = delta['stop_sequence']
-                    usage = data.get('usage', {})
-                    if usage:
-                        if message_data['usage'] is None:
-                            message_data['usage'] = {}
-                        message_data['usage'].update(usage)
-
-                elif current_event == 'message_stop':
-                    pass
-
+                data = _json_loads(line[6:])
             except json.JSONDecodeError:
-                continue
-
-    return message_data
-
-
-def _parse_openai_sse_stream(lines: list[str]) -> dict[str, Any]:
-    """Parse OpenAI-format SSE stream (data: only, ends with data: [DONE])."""
-    message_data = {
-        "id": None,
-        "type": "message",
-        "role": "assistant",
-        "content": [],
-        "model": None,
-        "finish_reason": None,
-        "usage": None
-    }
-
-    text_content = ""
-
-    for line in lines:
+                return
+
+            message_data = self.message_data
+            current_event = self.current_event
+
+            if current_event == 'message_start':
+                msg = data.get('message', {})
+                message_data['id'] = msg.get('id')
+                message_data['model'] = msg.get('model')
+                message_data['role'] = msg.get('role', 'assistant')
+                message_data['usage'] = msg.get('usage')
+
+            elif current_event == 'content_block_start':
+                block = data.get('content_block', {})
+                self.current_content_block = {
+                    'type': block.get('type'),
+                    'text': '' if block.get('type') == 'text' else None
+                }
+                if block.get('type') == 'thinking':
+                    self.current_content_block['thinking'] = ''
+
+            elif current_event == 'content_block_delta':
+                delta = data.get('delta', {})
+                if self.current_content_block:
+                    if delta.get('type') == 'text_delta':
+                        self.current_content_block['text'] += delta.get('text', '')
+                    elif delta.get('type') == 'thinking_delta':
+                        self.current_content_block['thinking'] += delta.get('thinking', '')
+
+            elif current_event == 'content_block_stop':
+                if self.current_content_block:
+                    message_data['content'].append(self.current_content_block)
+                    self.current_content_block = None
+
+            elif current_event == 'message_delta':
+                delta = data.get('delta', {})
+                if 'stop_reason' in delta:
+                    message_data['stop_reason'] = delta['stop_reason']
+                if 'stop_sequence' in delta:
+                    message_data['stop_sequence'] = delta['stop_sequence']
+                usage = data.get('usage', {})
+                if usage:
+                    if message_data['usage'] is None:
+                        message_data['usage'] = {}
+                    message_data['usage'].update(usage)
+
+    def result(self) -> dict[str, Any]:
+        return self.message_data
+
+
+class _OpenAIStream:
+    """Line-at-a-time aggregation of an OpenAI-format SSE stream."""
+
+    def __init__(self):
+        self.message_data = {
+            "id": None,
+            "type": "message",
+            "role": "assistant",
+            "content": [],
+            "model": None,
+            "finish_reason": None,
+            "usage": None
+        }
+        self.text_parts: list[str] = []
+        self.done = False
+
+    def feed_line(self, line: str) -> None:
+        if self.done:
+            return
         line = line.strip()
 
         if line.startswith('data: '):
@@ -173,45 +329,48 @@ def _parse_openai_sse_stream(lines: list[str]) -> dict[str, Any]:
 
             # Check for [DONE] marker
             if data_str == '[DONE]':
-                break
+                self.done = True
+                return
 
             try:
-                data = json.loads(data_str)
-
-                # Extract metadata from first chunk
-                if message_data['id'] is None:
-                    message_data['id'] = data.get('id')
-                    message_data['model'] = data.get('model')
+                data = _json_loads(data_str)
+            except json.JSONDecodeError:
+                return
 
-                # Extract content deltas
-                choices = data.get('choices', [])
-                if choices:
-                    choice = choices[0]
-                    delta = choice.get('delta', {})
+            message_data = self.message_data
 
-                    # Accumulate text content
-                    if 'content' in delta and delta['content']:
-                        text_content += delta['content']
+            # Extract metadata from first chunk
+            if message_data['id'] is None:
+                message_data['id'] = data.get('id')
+                message_data['model'] = data.get('model')
 
-                    # Check for finish reason
-                    if 'finish_reason' in choice and choice['finish_reason']:
-                        message_data['finish_reason'] = choice['finish_reason']
+            # Extract content deltas
+            choices = data.get('choices', [])
+            if choices:
+                choice = choices[0]
+                delta = choice.get('delta', {})
 
-                # Extract usage if present (usually in last chunk)
-                if 'usage' in data:
-                    message_data['usage'] = data['usage']
+                # Accumulate text content
+                if 'content' in delta and delta['content']:
+                    self.text_parts.append(delta['content'])
 
-            except json.JSONDecodeError:
-                continue
+                # Check for finish reason
+                if 'finish_reason' in choice and choice['finish_reason']:
+                    message_data['finish_reason'] = choice['finish_reason']
 
-    # Add accumulated text as content block
-    if text_content:
-        message_data['content'].append({
-            'type': 'text',
-            'text': text_content
-        })
+            # Extract usage if present (usually in last chunk)
+            if 'usage' in data:
+                message_data['usage'] = data['usage']
 
-    return message_data
+    def result(self) -> dict[str, Any]:
+        # Add accumulated text as content block
+        text_content = ''.join(self.text_parts)
+        if text_content:
+            self.message_data['content'].append({
+                'type': 'text',
+                'text': text_content
+            })
+        return self.message_data
 
 
 def is_sse_stream(content: bytes, headers: dict) -> bool:
@@ -267,7 +426,7 @@ def proxy(path: str) -> Response:
 
     try:
         # Forward request to upstream
-        upstream_response = requests.request(
+        upstream_response = upstream_session.request(
             method=request.method,
             url=upstream_url,
             headers=headers,
@@ -352,22 +511,34 @@ def _handle_streaming_response(
 ) -> Response:
     """Handle streaming SSE responses with real-time passthrough and logging."""
 
-    # Accumulate chunks for logging
-    accumulated_chunks = []
+    # Parse events as chunks pass through; keep only a raw preview for errors
+    parser = SSEParser()
+    raw_preview = bytearray()
+    parse_error = None
 
     def generate():
-        """Generator that yields chunks while accumulating for logging."""
+        """Generator that yields chunks while parsing them for logging."""
+        nonlocal parse_error
         try:
             for chunk in upstream_response.iter_content(chunk_size=None):
                 if chunk:
-                    # Accumulate for logging
-                    accumulated_chunks.append(chunk)
+                    if len(raw_preview) < RAW_PREVIEW_BYTES:
+                        raw_preview.extend(chunk[:RAW_PREVIEW_BYTES - len(raw_preview)])
+                    if parse_error is None:
+                        try:
+                            parser.feed(chunk)
+                        except Exception as e:
+                            parse_error = e
                     # Stream to client immediately
                     yield chunk
         finally:
+            # Return the connection to the pool (or drop it if the client left early)
+            upstream_response.close()
             # Log after streaming completes
             _log_streaming_response(
-                accumulated_chunks,
+                parser,
+                parse_error,
+                raw_preview,
                 upstream_response,
                 log_data,
                 request_timestamp
@@ -387,7 +558,9 @@ def _handle_streaming_response(
 
 
 def _log_streaming_response(
-    accumulated_chunks: list[bytes],
+    parser: SSEParser,
+    parse_error: Exception | None,
+    raw_preview: bytearray,
     upstream_response: requests.Response,
     log_data: dict,
     request_timestamp: datetime
@@ -395,20 +568,18 @@ def _log_streaming_response(
     """Log streaming response after it completes."""
     response_timestamp = datetime.utcnow()
 
-    # Combine all chunks
-    response_body = b''.join(accumulated_chunks)
-
     # Parse response body for logging
     response_body_parsed = None
-    if response_body:
+    if raw_preview:
         try:
-            stream_text = response_body.decode("utf-8", errors="replace")
-            response_body_parsed = parse_sse_stream(stream_text)
+            if parse_error is not None:
+                raise parse_error
+            response_body_parsed = parser.close()
         except Exception as e:
             # If parsing fails, log the raw stream (truncated)
             response_body_parsed = {
                 "error": f"Failed to parse SSE stream: {str(e)}",
-                "raw_preview": response_body.decode("utf-8", errors="replace")[:1000]
+                "raw_preview": raw_preview.decode("utf-8", errors="replace")[:1000]
             }
 
     # Log response
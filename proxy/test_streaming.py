@@ -9,6 +9,9 @@ import time
 import sys
 
 
+STREAM_CHUNK_SIZE = 8192
+
+
 def test_streaming_response(proxy_url: str, test_type: str = "anthropic"):
     """
     Test streaming response from proxy.
@@ -71,7 +74,9 @@ def test_streaming_response(proxy_url: str, test_type: str = "anthropic"):
         chunk_count = 0
         first_chunk_time = None
         
-        for chunk in response.iter_content(chunk_size=None):
+        # Read in 8 KiB blocks; chunked SSE responses still yield each
+        # upstream chunk as it arrives, so TTFB stays per-event
+        for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
             if chunk:
                 chunk_count += 1
                 if first_chunk_time is None:
@@ -10,17 +10,63 @@ Builds a directed graph showing:
 """
 
 from typing import Dict, List, Any, Optional, Set, Tuple
-from datetime import datetime
+from array import array
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate
+import bisect
 import hashlib
 
+try:
+    from ciso8601 import parse_datetime as _parse_iso8601
+except ImportError:  # optional speedup, falls back to datetime.fromisoformat
+    _parse_iso8601 = None
 
-def detect_sessions(logs: List[Dict[str, Any]], gap_minutes: float = 10.0) -> List[Tuple[int, int]]:
+
+# Content reuse compares the first 200 normalized chars (see hash_content),
+# after a cheaper check on the first 32
+CONTENT_REUSE_LENGTH = 200
+CONTENT_REUSE_SHORT_LENGTH = 32
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def parse_timestamp_us(timestamp: Any) -> Optional[int]:
+    """
+    Parse an ISO 8601 timestamp into integer microseconds since the epoch.
+
+    Integer microseconds keep differences exact: (b - a) / 10**6 equals
+    timedelta.total_seconds() on the parsed datetimes. Naive timestamps are
+    taken as UTC. Returns None for missing or unparseable timestamps.
+    """
+    if not timestamp:
+        return None
+    try:
+        if _parse_iso8601 is not None:
+            dt = _parse_iso8601(timestamp)
+        else:
+            dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+    except (ValueError, TypeError, AttributeError):
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return (dt - _EPOCH) // _MICROSECOND
+
+
+def parse_log_timestamps(logs: List[Dict[str, Any]]) -> List[Optional[int]]:
+    """Parse every log's timestamp once, for reuse by the detectors."""
+    return [parse_timestamp_us(log.get('timestamp', '')) for log in logs]
+
+
+def detect_sessions(logs: List[Dict[str, Any]], gap_minutes: float = 10.0,
+                    timestamps_us: Optional[List[Optional[int]]] = None) -> List[Tuple[int, int]]:
     """
     Detect session boundaries based on time gaps.
 
     Args:
         logs: List of log entries (must be sorted by timestamp)
         gap_minutes: Minimum gap in minutes to consider a new session (default: 10)
+        timestamps_us: Optional parse_log_timestamps(logs), to avoid re-parsing
 
     Returns:
         List of (start_index, end_index) tuples for each session
@@ -28,46 +74,124 @@ def detect_sessions(logs: List[Dict[str, Any]], gap_minutes: float = 10.0) -> Li
     if not logs:
         return []
 
-    sessions = []
-    current_session_start = 0
-    prev_time = None
+    if timestamps_us is None:
+        timestamps_us = parse_log_timestamps(logs)
 
-    for i, log in enumerate(logs):
-        timestamp = log.get('timestamp', '')
-        if not timestamp:
-            continue
+    # A session starts at every log whose gap to the previous timestamped
+    # log exceeds the limit; logs without a timestamp never split a session
+    timed = [(i, t) for i, t in enumerate(timestamps_us) if t is not None]
+    gap_limit = gap_minutes * 60
+    starts = [i for (_, prev_time), (i, curr_time) in zip(timed, timed[1:])
+              if (curr_time - prev_time) / 10**6 > gap_limit]
 
-        try:
-            curr_time = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-        except (ValueError, AttributeError):
-            continue
+    bounds = [0] + starts + [len(logs)]
+    return [(start, end - 1) for start, end in zip(bounds, bounds[1:])]
+
+
+def preprocess_logs(logs: List[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    """
+    Walk each log's request and response once and collect what the edge detectors need.
+
+    Args:
+        logs: List of log entries
 
-        if prev_time:
-            gap_seconds = (curr_time - prev_time).total_seconds()
-            if gap_seconds > (gap_minutes * 60):
-                # Session boundary detected
-                sessions.append((current_session_start, i - 1))
-                current_session_start = i
+    Returns:
+        Dictionary of lists parallel to logs:
+        - tool_uses: (id, name, input) for each response tool_use block
+        - tool_results: (tool_use_id, is_error) for each request tool_result block with an id
+        - request_texts: each non-empty request text
+        - first_message_hash: 300-char hash of the first request message, or ""
+        - response_key: normalized 200-char prefix of the joined response text, or None
+    """
+    pre = {
+        'tool_uses': [],
+        'tool_results': [],
+        'request_texts': [],
+        'first_message_hash': [],
+        'response_key': [],
+    }
+
+    # Logs come straight from JSON, so exact type checks stand in for
+    # isinstance() in this per-block loop
+    for log in logs:
+        tool_uses = []
+        tool_results = []
+        request_texts = []
+        first_message_hash = ""
+        response_key = None
+
+        # Request side: tool results, message texts and the first message
+        messages = log.get('body', {}).get('messages', [])
+        if type(messages) is list:
+            for msg_idx, message in enumerate(messages):
+                if type(message) is not dict:
+                    continue
 
-        prev_time = curr_time
+                content = message.get('content', [])
+                if type(content) is str:
+                    texts = (content,)
+                    if msg_idx == 0:
+                        first_message_hash = hash_content(content, length=300)
+                elif type(content) is list:
+                    texts = []
+                    for block in content:
+                        if type(block) is not dict:
+                            continue
+                        block_type = block.get('type')
+                        if block_type == 'text':
+                            text = block.get('text', '')
+                            if msg_idx == 0 and len(texts) == 0:
+                                first_message_hash = hash_content(text, length=300)
+                            texts.append(text)
+                        elif block_type == 'tool_result':
+                            tool_use_id = block.get('tool_use_id')
+                            if tool_use_id:
+                                tool_results.append((tool_use_id, block.get('is_error', False)))
+                else:
+                    continue
 
-    # Add final session
-    if current_session_start < len(logs):
-        sessions.append((current_session_start, len(logs) - 1))
+                request_texts.extend(text for text in texts if text)
 
-    return sessions
+        # Response side: tool uses and the joined text
+        content = log.get('response', {}).get('body', {}).get('content', [])
+        if type(content) is list:
+            response_texts = []
+            for block in content:
+                if type(block) is not dict:
+                    continue
+                block_type = block.get('type')
+                if block_type == 'tool_use':
+                    tool_uses.append((block.get('id'), block.get('name'), block.get('input', {})))
+                elif block_type == 'text':
+                    text = block.get('text', '')
+                    if text:
+                        response_texts.append(text)
 
+            text_content = '\n'.join(response_texts)
+            if text_content:
+                response_key = normalize_prefix(text_content, CONTENT_REUSE_LENGTH)
 
-def build_tool_index(logs: List[Dict[str, Any]], session_id: Optional[int] = None) -> Tuple[Dict[str, int], Dict[str, str]]:
+        pre['tool_uses'].append(tool_uses)
+        pre['tool_results'].append(tool_results)
+        pre['request_texts'].append(request_texts)
+        pre['first_message_hash'].append(first_message_hash)
+        pre['response_key'].append(response_key)
+
+    return pre
+
+
+def build_tool_index(logs: List[Dict[str, Any]], session_id: Optional[int] = None,
+                     pre: Optional[Dict[str, List[Any]]] = None) -> Tuple[Dict[str, int], Dict[str, str]]:
     """
     Create tool_use_id → log_index and tool_use_id → tool_name mappings.
 
-    IMPORTANT: To prevent cross-session edge contamination, tool_use_ids are prefixed
-    with session_id if provided. This ensures tool_use_ids are unique across sessions.
+    IMPORTANT: To prevent cross-session edge contamination, build one index per
+    session; tool_use_ids are only unique within a session.
 
     Args:
         logs: List of log entries
-        session_id: Optional session ID to prefix tool_use_ids (prevents cross-session matches)
+        session_id: Unused; kept for compatibility (ids used to be prefixed with it)
+        pre: Optional preprocess_logs(logs), to avoid re-walking the logs
 
     Returns:
         Tuple of (tool_index, tool_names) dictionaries
@@ -75,93 +199,66 @@ def build_tool_index(logs: List[Dict[str, Any]], session_id: Optional[int] = Non
     tool_index = {}
     tool_names = {}
 
-    for idx, log in enumerate(logs):
-        # Extract tool_use blocks from response
-        response_body = log.get('response', {}).get('body', {})
-        content = response_body.get('content', [])
+    if pre is None:
+        pre = preprocess_logs(logs)
 
-        if not isinstance(content, list):
-            continue
-
-        for block in content:
-            if isinstance(block, dict) and block.get('type') == 'tool_use':
-                tool_use_id = block.get('id')
-                tool_name = block.get('name')
-                if tool_use_id:
-                    # Prefix with session_id to prevent cross-session collisions
-                    if session_id is not None:
-                        tool_use_id = f"session_{session_id}_{tool_use_id}"
-                    tool_index[tool_use_id] = idx
-                    tool_names[tool_use_id] = tool_name
+    for idx, tool_uses in enumerate(pre['tool_uses']):
+        for tool_use_id, tool_name, _ in tool_uses:
+            if tool_use_id:
+                tool_index[tool_use_id] = idx
+                tool_names[tool_use_id] = tool_name
 
     return tool_index, tool_names
 
 
-def match_tool_results(logs: List[Dict[str, Any]], tool_index: Dict[str, int], tool_names: Dict[str, str], session_id: Optional[int] = None) -> List[Dict[str, Any]]:
+def match_tool_results(logs: List[Dict[str, Any]], tool_index: Dict[str, int], tool_names: Dict[str, str], session_id: Optional[int] = None,
+                       pre: Optional[Dict[str, List[Any]]] = None) -> List[Dict[str, Any]]:
     """
     Find tool result dependencies by matching tool_use_id references.
 
-    IMPORTANT: Uses session-prefixed tool_use_ids to prevent cross-session edge contamination.
+    IMPORTANT: tool_index must come from build_tool_index on the same session's logs
+    to prevent cross-session edge contamination.
 
     Args:
         logs: List of log entries
         tool_index: Mapping of tool_use_id to log index
         tool_names: Mapping of tool_use_id to tool name
-        session_id: Optional session ID to prefix tool_use_ids (must match build_tool_index)
+        session_id: Unused; kept for compatibility (ids used to be prefixed with it)
+        pre: Optional preprocess_logs(logs), to avoid re-walking the logs
 
     Returns:
         List of edge dictionaries with type='tool_result'
     """
     edges = []
 
-    for target_idx, log in enumerate(logs):
-        # Extract tool_result blocks from request
-        request_body = log.get('body', {})
-        messages = request_body.get('messages', [])
-
-        if not isinstance(messages, list):
-            continue
-
-        for message in messages:
-            if not isinstance(message, dict):
-                continue
-
-            content = message.get('content', [])
-            if not isinstance(content, list):
-                continue
-
-            for block in content:
-                if isinstance(block, dict) and block.get('type') == 'tool_result':
-                    tool_use_id = block.get('tool_use_id')
-                    is_error = block.get('is_error', False)
-
-                    if tool_use_id:
-                        # Prefix with session_id to match tool_index keys
-                        if session_id is not None:
-                            prefixed_tool_use_id = f"session_{session_id}_{tool_use_id}"
-                        else:
-                            prefixed_tool_use_id = tool_use_id
-
-                        if prefixed_tool_use_id in tool_index:
-                            source_idx = tool_index[prefixed_tool_use_id]
-                            tool_name = tool_names.get(prefixed_tool_use_id)
-
-                            edges.append({
-                                'type': 'tool_result',
-                                'source': source_idx,
-                                'target': target_idx,
-                                'metadata': {
-                                    'tool_use_id': tool_use_id,  # Store original ID without prefix
-                                    'tool_name': tool_name,
-                                    'is_error': is_error
-                                },
-                                'confidence': 1.0
-                            })
+    if pre is None:
+        pre = preprocess_logs(logs)
+
+    tool_index_get = tool_index.get
+    for target_idx, tool_results in enumerate(pre['tool_results']):
+        for tool_use_id, is_error in tool_results:
+            source_idx = tool_index_get(tool_use_id)
+            if source_idx is not None:
+                tool_name = tool_names.get(tool_use_id)
+
+                edges.append({
+                    'type': 'tool_result',
+                    'source': source_idx,
+                    'target': target_idx,
+                    'metadata': {
+                        'tool_use_id': tool_use_id,
+                        'tool_name': tool_name,
+                        'is_error': is_error
+                    },
+                    'confidence': 1.0
+                })
 
     return edges
 
 
-def detect_subagent_spawns(logs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def detect_subagent_spawns(logs: List[Dict[str, Any]],
+                           timestamps_us: Optional[List[Optional[int]]] = None,
+                           pre: Optional[Dict[str, List[Any]]] = None) -> List[Dict[str, Any]]:
     """
     Identify parent-child relationships via Task tool usage.
 
@@ -173,93 +270,98 @@ def detect_subagent_spawns(logs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
 
     Args:
         logs: List of log entries
+        timestamps_us: Optional parse_log_timestamps(logs), to avoid re-parsing
+        pre: Optional preprocess_logs(logs), to avoid re-walking the logs
 
     Returns:
         List of edge dictionaries with type='subagent_spawn'
     """
     edges = []
 
+    if timestamps_us is None:
+        timestamps_us = parse_log_timestamps(logs)
+    if pre is None:
+        pre = preprocess_logs(logs)
+
     # Find all Task tool uses
     task_spawns = []
-    for idx, log in enumerate(logs):
-        response_body = log.get('response', {}).get('body', {})
-        content = response_body.get('content', [])
+    for idx, tool_uses in enumerate(pre['tool_uses']):
+        for task_tool_id, tool_name, tool_input in tool_uses:
+            if tool_name != 'Task':
+                continue
 
-        if not isinstance(content, list):
-            continue
+            subagent_type = tool_input.get('subagent_type')
+            prompt = tool_input.get('prompt', '')
 
-        for block in content:
-            if isinstance(block, dict) and block.get('type') == 'tool_use' and block.get('name') == 'Task':
-                tool_input = block.get('input', {})
-                subagent_type = tool_input.get('subagent_type')
-                task_tool_id = block.get('id')
-                prompt = tool_input.get('prompt', '')
-
-                if subagent_type:
-                    task_spawns.append({
-                        'parent_idx': idx,
-                        'subagent_type': subagent_type,
-                        'task_tool_id': task_tool_id,
-                        'prompt': prompt,
-                        'prompt_hash': hash_content(prompt, length=300) if prompt else None,
-                        'timestamp': log.get('timestamp')
-                    })
+            if subagent_type:
+                task_spawns.append({
+                    'parent_idx': idx,
+                    'subagent_type': subagent_type,
+                    'task_tool_id': task_tool_id,
+                    'prompt': prompt,
+                    'prompt_hash': hash_content(prompt, length=300) if prompt else None,
+                    'timestamp': logs[idx].get('timestamp')
+                })
+
+    # Index each log's first message hash, so a spawn looks up its
+    # candidates instead of re-hashing every later log
+    first_msg_hashes = pre['first_message_hash']
+    first_msg_index: Dict[str, List[int]] = {}
+    for idx, msg_hash in enumerate(first_msg_hashes):
+        if msg_hash:
+            first_msg_index.setdefault(msg_hash, []).append(idx)
+
+    # With non-decreasing timestamps the first indexed candidate after the
+    # parent is the one the forward scan would stop at
+    known_times = [t for t in timestamps_us if t is not None]
+    is_time_ordered = all(a <= b for a, b in zip(known_times, known_times[1:]))
 
     # Match spawns to subsequent agent instances
     for spawn in task_spawns:
         parent_idx = spawn['parent_idx']
         subagent_type = spawn['subagent_type']
         prompt_hash = spawn['prompt_hash']
-        spawn_time = datetime.fromisoformat(spawn['timestamp'].replace('Z', '+00:00'))
+        spawn_time = timestamps_us[parent_idx]
 
         # Search forward for matching agent by prompt content
         best_match = None
         min_time_diff = float('inf')
         match_method = 'none'
 
-        # Only try to match if we have a prompt hash
-        if not prompt_hash:
+        # Only try to match if we have a prompt hash and a spawn time
+        if not prompt_hash or spawn_time is None:
             continue
 
-        for idx in range(parent_idx + 1, len(logs)):
-            log = logs[idx]
-
-            # Early termination: stop if we've gone past 1 hour window
-            log_time = datetime.fromisoformat(log.get('timestamp').replace('Z', '+00:00'))
-            time_diff = (log_time - spawn_time).total_seconds()
-
-            if time_diff > 3600:
-                # Logs are sorted by time, so no point continuing
-                break
-
-            # Check first message in request for prompt match
-            messages = log.get('body', {}).get('messages', [])
-            if isinstance(messages, list) and len(messages) > 0:
-                first_msg = messages[0]
-                if isinstance(first_msg, dict):
-                    msg_content = first_msg.get('content', '')
-
-                    # Handle both string and array content
-                    msg_hash = None
-                    if isinstance(msg_content, str):
-                        msg_hash = hash_content(msg_content, length=300)
-                    elif isinstance(msg_content, list):
-                        # Extract text from content blocks
-                        for block in msg_content:
-                            if isinstance(block, dict) and block.get('type') == 'text':
-                                text = block.get('text', '')
-                                msg_hash = hash_content(text, length=300)
-                                break
-
-                    # Check for prompt match
-                    if msg_hash and msg_hash == prompt_hash:
-                        # Prompt match found - take first match within time window
-                        if 0 <= time_diff and time_diff < min_time_diff:
-                            best_match = idx
-                            min_time_diff = time_diff
-                            match_method = 'prompt_hash'
-                            # Break early on prompt match since it's very specific
-                            break
+        if is_time_ordered:
+            candidates = first_msg_index.get(prompt_hash, ())
+            pos = bisect.bisect_right(candidates, parent_idx)
+            while pos < len(candidates) and timestamps_us[candidates[pos]] is None:
+                pos += 1
+            if pos < len(candidates):
+                idx = candidates[pos]
+                time_diff = (timestamps_us[idx] - spawn_time) / 10**6
+                if time_diff <= 3600:
+                    best_match = idx
+                    min_time_diff = time_diff
+                    match_method = 'prompt_hash'
+        else:
+            for idx in range(parent_idx + 1, len(logs)):
+                log_time = timestamps_us[idx]
+                if log_time is None:
+                    continue
+
+                # Early termination: stop if we've gone past 1 hour window
+                time_diff = (log_time - spawn_time) / 10**6
+
+                if time_diff > 3600:
+                    break
+
+                # Prompt match found - take first match within time window
+                if first_msg_hashes[idx] == prompt_hash and 0 <= time_diff:
+                    best_match = idx
+                    min_time_diff = time_diff
+                    match_method = 'prompt_hash'
+                    break
 
         if best_match is not None:
             edges.append({
@@ -279,6 +381,33 @@ def detect_subagent_spawns(logs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     return edges
 
 
+def _response_preview(log: Dict[str, Any]) -> str:
+    """First 100 chars of a log's joined response text, for content reuse metadata."""
+    content = log.get('response', {}).get('body', {}).get('content', [])
+    text_content = '\n'.join(
+        block.get('text', '') for block in content
+        if isinstance(block, dict) and block.get('type') == 'text' and block.get('text', '')
+    )
+    return text_content[:100].replace('\n', ' ')
+
+
+def normalize_prefix(text: str, length: int) -> str:
+    """
+    Collapse whitespace runs to single spaces and return the first N characters.
+
+    Same result as ' '.join(text.split())[:length]. Normalizing a prefix of
+    the text yields a prefix of the fully normalized text, so only a slice is
+    split, growing it when runs of whitespace leave it too short.
+    """
+    span = length * 2
+    while True:
+        normalized = ' '.join(text[:span].split())
+        if len(normalized) >= length or span >= len(text):
+            break
+        span *= 2
+    return normalized[:length]
+
+
 def hash_content(text: str, length: int = 200) -> str:
     """
     Hash the first N characters of text content for matching.
@@ -288,14 +417,13 @@ def hash_content(text: str, length: int = 200) -> str:
         length: Number of characters to use (default: 200)
 
     Returns:
-        SHA256 hash of the first N characters
+        BLAKE2b (128-bit) hash of the first N characters
     """
     if not text:
         return ""
 
-    # Normalize whitespace and take first N characters
-    normalized = ' '.join(text.split())[:length]
-    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+    normalized = normalize_prefix(text, length)
+    return hashlib.blake2b(normalized.encode('utf-8'), digest_size=16).hexdigest()
 
 
 def extract_text_content(content_blocks: List[Any]) -> str:
@@ -322,87 +450,73 @@ def extract_text_content(content_blocks: List[Any]) -> str:
     return '\n'.join(texts)
 
 
-def detect_content_reuse(logs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def detect_content_reuse(logs: List[Dict[str, Any]],
+                         pre: Optional[Dict[str, List[Any]]] = None) -> List[Dict[str, Any]]:
     """
     Identify content reuse edges where one agent's output is used in another agent's input.
 
-    Uses content hashing (first 200 chars) to match response text to subsequent request messages.
+    Compares the first 200 normalized chars of response text with subsequent request messages.
 
     Args:
         logs: List of log entries
+        pre: Optional preprocess_logs(logs), to avoid re-walking the logs
 
     Returns:
         List of edge dictionaries with type='content_reuse'
     """
     edges = []
 
-    # Build index of response content hashes
-    response_hashes = {}  # hash -> list of (log_idx, full_text_preview)
-
-    for idx, log in enumerate(logs):
-        response_body = log.get('response', {}).get('body', {})
-        content = response_body.get('content', [])
-
-        text_content = extract_text_content(content)
-        if text_content:
-            content_hash = hash_content(text_content)
-            if content_hash:
-                if content_hash not in response_hashes:
-                    response_hashes[content_hash] = []
-                # Store preview (first 100 chars for metadata)
-                preview = text_content[:100].replace('\n', ' ')
-                response_hashes[content_hash].append((idx, preview))
-
-    # Search for matching content in subsequent requests
-    for target_idx, log in enumerate(logs):
-        request_body = log.get('body', {})
-        messages = request_body.get('messages', [])
-
-        if not isinstance(messages, list):
-            continue
-
-        for message in messages:
-            if not isinstance(message, dict):
+    if pre is None:
+        pre = preprocess_logs(logs)
+
+    # Index of responses seen so far, keyed by the normalized 200-char prefix
+    # that hash_content() would hash: key -> log_idx, or a list of log indices
+    # once a key repeats. Each log's request is matched before its own
+    # response is indexed, so every source found comes before the target and
+    # sources never need filtering.
+    response_index = {}
+    # Shorter prefixes of the same keys: most request texts match no response,
+    # and checking a short prefix first rules them out without normalizing
+    # the full 200 chars
+    short_keys = set()
+    previews = {}
+
+    for target_idx, request_texts in enumerate(pre['request_texts']):
+        # Search for matching content in this request
+        for text in request_texts if short_keys else ():
+            if normalize_prefix(text, CONTENT_REUSE_SHORT_LENGTH) not in short_keys:
                 continue
+            sources = response_index.get(normalize_prefix(text, CONTENT_REUSE_LENGTH))
+            if sources is not None:
+                if type(sources) is int:
+                    sources = (sources,)
+                for source_idx in sources:
+                    # Previews are only built for responses that end up as edge sources
+                    preview = previews.get(source_idx)
+                    if preview is None:
+                        preview = previews[source_idx] = _response_preview(logs[source_idx])
+                    edges.append({
+                        'type': 'content_reuse',
+                        'source': source_idx,
+                        'target': target_idx,
+                        'metadata': {
+                            'content_preview': preview,
+                            'match_method': 'hash_200char'
+                        },
+                        'confidence': 0.95
+                    })
 
-            content = message.get('content', [])
-            if isinstance(content, str):
-                # Handle string content
-                content_hash = hash_content(content)
-                if content_hash in response_hashes:
-                    for source_idx, preview in response_hashes[content_hash]:
-                        # Only create edge if source comes before target
-                        if source_idx < target_idx:
-                            edges.append({
-                                'type': 'content_reuse',
-                                'source': source_idx,
-                                'target': target_idx,
-                                'metadata': {
-                                    'content_preview': preview,
-                                    'match_method': 'hash_200char'
-                                },
-                                'confidence': 0.95
-                            })
-            elif isinstance(content, list):
-                # Handle array content
-                for block in content:
-                    if isinstance(block, dict) and block.get('type') == 'text':
-                        text = block.get('text', '')
-                        if text:
-                            content_hash = hash_content(text)
-                            if content_hash in response_hashes:
-                                for source_idx, preview in response_hashes[content_hash]:
-                                    if source_idx < target_idx:
-                                        edges.append({
-                                            'type': 'content_reuse',
-                                            'source': source_idx,
-                                            'target': target_idx,
-                                            'metadata': {
-                                                'content_preview': preview,
-                                                'match_method': 'hash_200char'
-                                            },
-                                            'confidence': 0.95
-                                        })
+        # Index this log's response for later requests
+        content_key = pre['response_key'][target_idx]
+        if content_key is not None:
+            sources = response_index.get(content_key)
+            if sources is None:
+                response_index[content_key] = target_idx
+                short_keys.add(content_key[:CONTENT_REUSE_SHORT_LENGTH])
+            elif type(sources) is int:
+                response_index[content_key] = [sources, target_idx]
+            else:
+                sources.append(target_idx)
 
     return edges
 
@@ -422,11 +536,22 @@ def build_workflow_graph(logs: List[Dict[str, Any]], max_logs_per_session: int =
     if not logs:
         return {'nodes': [], 'edges': [], 'sessions': [], 'metrics': {}}
 
-    # Sort logs chronologically (oldest first) for graph computation
-    sorted_logs = sorted(logs, key=lambda x: x.get('timestamp', ''))
+    # Sort logs chronologically (oldest first) for graph computation. Keys are
+    # read once; log_api already hands logs over in order, so usually the
+    # check below is all that runs.
+    sort_keys = [log.get('timestamp', '') for log in logs]
+    if all(a <= b for a, b in zip(sort_keys, sort_keys[1:])):
+        sorted_logs = list(logs)
+    else:
+        order = sorted(range(len(logs)), key=sort_keys.__getitem__)
+        sorted_logs = [logs[i] for i in order]
+
+    # Parse timestamps once for session detection and spawn matching
+    sorted_timestamps_us = parse_log_timestamps(sorted_logs)
 
     # Detect session boundaries
-    sessions = detect_sessions(sorted_logs, gap_minutes=session_gap_minutes)
+    sessions = detect_sessions(sorted_logs, gap_minutes=session_gap_minutes,
+                               timestamps_us=sorted_timestamps_us)
 
     print(f"Detected {len(sessions)} sessions from {len(sorted_logs)} logs")
     for idx, (start, end) in enumerate(sessions):
@@ -442,21 +567,26 @@ def build_workflow_graph(logs: List[Dict[str, Any]], max_logs_per_session: int =
 
     for session_idx, (session_start, session_end) in enumerate(sessions):
         session_logs = sorted_logs[session_start:session_end + 1]
+        session_timestamps_us = sorted_timestamps_us[session_start:session_end + 1]
 
         # Apply per-session cap
         if len(session_logs) > max_logs_per_session:
             print(f"  Session {session_idx + 1}: Capping at {max_logs_per_session} most recent logs")
             session_logs = session_logs[-max_logs_per_session:]
+            session_timestamps_us = session_timestamps_us[-max_logs_per_session:]
 
         session_node_start = len(all_nodes)
 
-        # Build tool index for this session with session_id prefix to prevent cross-session contamination
-        tool_index, tool_names = build_tool_index(session_logs, session_id=session_idx)
+        # Walk each log once; the edge detectors below share the result
+        pre = preprocess_logs(session_logs)
+
+        # Build a tool index for this session only to prevent cross-session contamination
+        tool_index, tool_names = build_tool_index(session_logs, pre=pre)
 
-        # Find edges within this session (using session_id prefix)
-        tool_edges = match_tool_results(session_logs, tool_index, tool_names, session_id=session_idx)
-        spawn_edges = detect_subagent_spawns(session_logs)
-        content_edges = detect_content_reuse(session_logs)
+        # Find edges within this session
+        tool_edges = match_tool_results(session_logs, tool_index, tool_names, pre=pre)
+        spawn_edges = detect_subagent_spawns(session_logs, timestamps_us=session_timestamps_us, pre=pre)
+        content_edges = detect_content_reuse(session_logs, pre=pre)
 
         print(f"  Session {session_idx + 1}: {len(tool_edges)} tool edges, {len(spawn_edges)} spawn edges, {len(content_edges)} content reuse edges")
 
@@ -466,6 +596,8 @@ def build_workflow_graph(logs: List[Dict[str, Any]], max_logs_per_session: int =
             response = log.get('response', {})
             response_body = response.get('body', {})
             usage = response_body.get('usage', {})
+            input_tokens = usage.get('input_tokens', 0)
+            output_tokens = usage.get('output_tokens', 0)
 
             global_idx = len(all_nodes)
 
@@ -481,9 +613,9 @@ def build_workflow_graph(logs: List[Dict[str, Any]], max_logs_per_session: int =
                 'model': log.get('body', {}).get('model', 'unknown'),
                 'duration_ms': response.get('duration_ms'),
                 'tokens': {
-                    'input': usage.get('input_tokens', 0),
-                    'output': usage.get('output_tokens', 0),
-                    'total': usage.get('input_tokens', 0) + usage.get('output_tokens', 0)
+                    'input': input_tokens,
+                    'output': output_tokens,
+                    'total': input_tokens + output_tokens
                 },
                 'stop_reason': log.get('stop_reason'),
                 'has_errors': log.get('has_errors', False),
@@ -493,12 +625,13 @@ def build_workflow_graph(logs: List[Dict[str, Any]], max_logs_per_session: int =
             all_nodes.append(node)
 
         # Adjust edge indices to global indices
-        for edge in tool_edges + spawn_edges + content_edges:
+        session_edges = tool_edges + spawn_edges + content_edges
+        for edge in session_edges:
             edge['source'] = session_node_start + edge['source']
             edge['target'] = session_node_start + edge['target']
             edge['session_id'] = session_idx
 
-        all_edges.extend(tool_edges + spawn_edges + content_edges)
+        all_edges.extend(session_edges)
 
         # Store session metadata
         session_info.append({
@@ -506,7 +639,7 @@ def build_workflow_graph(logs: List[Dict[str, Any]], max_logs_per_session: int =
             'node_start': session_node_start,
             'node_end': len(all_nodes) - 1,
             'node_count': len(session_logs),
-            'edge_count': len(tool_edges) + len(spawn_edges) + len(content_edges),
+            'edge_count': len(session_edges),
             'start_time': session_logs[0].get('timestamp') if session_logs else None,
             'end_time': session_logs[-1].get('timestamp') if session_logs else None
         })
@@ -544,57 +677,79 @@ def compute_graph_metrics(nodes: List[Dict[str, Any]], edges: List[Dict[str, Any
 
     print(f"Computing metrics for {len(nodes)} nodes and {len(edges)} edges...")
 
-    # Count edge types
-    tool_edges = [e for e in edges if e['type'] == 'tool_result']
-    spawn_edges = [e for e in edges if e['type'] == 'subagent_spawn']
-    print(f"Edge types: {len(tool_edges)} tool, {len(spawn_edges)} spawn")
-
-    # Build adjacency lists
-    children = {i: [] for i in range(len(nodes))}
-    parents = {i: [] for i in range(len(nodes))}
-
+    # Read the edge dicts once: count edge types and copy endpoints into
+    # parallel int arrays that the rest of the metrics work from
+    sources = array('i')
+    targets = array('i')
+    tool_edge_count = 0
+    spawn_edge_count = 0
     for edge in edges:
-        source = edge['source']
-        target = edge['target']
-        children[source].append(target)
-        parents[target].append(source)
+        edge_type = edge['type']
+        if edge_type == 'tool_result':
+            tool_edge_count += 1
+        elif edge_type == 'subagent_spawn':
+            spawn_edge_count += 1
+        sources.append(edge['source'])
+        targets.append(edge['target'])
+    print(f"Edge types: {tool_edge_count} tool, {spawn_edge_count} spawn")
+
+    # Build adjacency in CSR form: the children of node i are
+    # child_ids[child_start[i]:child_start[i + 1]], in edge order
+    node_count = len(nodes)
+    out_degree = array('i', [0]) * node_count
+    in_degree = array('i', [0]) * node_count
+    for source, target in zip(sources, targets):
+        out_degree[source] += 1
+        in_degree[target] += 1
+
+    child_start = array('i', accumulate(out_degree, initial=0))
+    child_ids = array('i', [0]) * len(sources)
+    cursor = child_start[:-1]
+    for source, target in zip(sources, targets):
+        child_ids[cursor[source]] = target
+        cursor[source] += 1
 
     print("Built adjacency lists")
 
     # Find root nodes (no parents)
-    roots = [i for i in range(len(nodes)) if len(parents[i]) == 0]
+    roots = [i for i in range(node_count) if in_degree[i] == 0]
     print(f"Found {len(roots)} root nodes")
 
     # Calculate max depth using iterative BFS (much faster than recursive)
+    # Each root's BFS walks level by level, so its depth is the number of
+    # levels. seen[i] holds the index of the last root whose BFS reached i,
+    # which replaces a fresh visited set per root.
     max_depth = 0
     if roots:
-        from collections import deque
         print("Calculating max depth...")
-        for root in roots:
-            queue = deque([(root, 1)])
-            visited = set()
-            while queue:
-                node_id, depth = queue.popleft()
-                if node_id in visited:
-                    continue
-                visited.add(node_id)
-                max_depth = max(max_depth, depth)
-                for child in children[node_id]:
-                    if child not in visited:
-                        queue.append((child, depth + 1))
+        seen = array('i', [-1]) * node_count
+        for stamp, root in enumerate(roots):
+            seen[root] = stamp
+            frontier = [root]
+            depth = 0
+            while frontier:
+                depth += 1
+                next_frontier = []
+                for node_id in frontier:
+                    for child in child_ids[child_start[node_id]:child_start[node_id + 1]]:
+                        if seen[child] != stamp:
+                            seen[child] = stamp
+                            next_frontier.append(child)
+                frontier = next_frontier
+            max_depth = max(max_depth, depth)
         print(f"Max depth: {max_depth}")
 
     # Calculate branching factor
     print("Calculating branching factor...")
-    non_leaf_nodes = [i for i in range(len(nodes)) if children[i]]
-    avg_branching = sum(len(children[i]) for i in non_leaf_nodes) / len(non_leaf_nodes) if non_leaf_nodes else 0
+    non_leaf_count = sum(1 for degree in out_degree if degree)
+    avg_branching = sum(out_degree) / non_leaf_count if non_leaf_count else 0
     print(f"Avg branching factor: {avg_branching:.2f}")
 
     return {
         'total_nodes': len(nodes),
         'total_edges': len(edges),
-        'tool_dependency_count': len(tool_edges),
-        'subagent_spawn_count': len(spawn_edges),
+        'tool_dependency_count': tool_edge_count,
+        'subagent_spawn_count': spawn_edge_count,
         'max_depth': max_depth,
         'avg_branching_factor': round(avg_branching, 2),
         'root_count': len(roots)
@@ -6,9 +6,17 @@ Extracts all distinct system prompt combinations and provides statistics.
 
 import json
 import hashlib
+import heapq
 from pathlib import Path
 from collections import defaultdict
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+
+try:
+    import orjson
+except ImportError:  # optional speedup, falls back to stdlib json
+    orjson = None
+
+_json_loads = orjson.loads if orjson is not None else json.loads
 
 
 def extract_system_prompts(log_file_path: str) -> List[Dict[str, Any]]:
@@ -20,13 +28,13 @@ def extract_system_prompts(log_file_path: str) -> List[Dict[str, Any]]:
     """
     system_prompts = []
     
-    with open(log_file_path, 'r') as f:
+    with open(log_file_path, 'rb') as f:
         for line_num, line in enumerate(f, 1):
             if not line.strip():
                 continue
                 
             try:
-                log_entry = json.loads(line)
+                log_entry = _json_loads(line)
                 
                 # Extract system prompts from request body
                 body = log_entry.get('body', {})
@@ -63,42 +71,57 @@ def compute_prompt_hash(system_prompts: List[Dict[str, str]]) -> str:
     return hashlib.md5(combined.encode()).hexdigest()
 
 
-def group_by_combination(system_prompts: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+def group_by_combination(system_prompts: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
     """
     Group system prompts by their combination (using hash).
+
+    Each group holds its 'entries', the set of 'models' seen and the entry
+    'count', collected in the same pass so the report doesn't rescan entries.
     """
-    grouped = defaultdict(list)
+    grouped = defaultdict(lambda: {'entries': [], 'models': set(), 'count': 0})
     
     for entry in system_prompts:
         prompt_hash = compute_prompt_hash(entry['system'])
-        grouped[prompt_hash].append(entry)
+        group = grouped[prompt_hash]
+        group['entries'].append(entry)
+        group['models'].add(entry['model'])
+        group['count'] += 1
     
     return grouped
 
 
-def print_summary(grouped: Dict[str, List[Dict[str, Any]]]):
+def print_summary(grouped: Dict[str, Dict[str, Any]]):
     """
     Print summary statistics.
     """
     print("=" * 80)
     print("SYSTEM PROMPTS ANALYSIS SUMMARY")
     print("=" * 80)
-    print(f"\nTotal log entries with system prompts: {sum(len(v) for v in grouped.values())}")
+    print(f"\nTotal log entries with system prompts: {sum(g['count'] for g in grouped.values())}")
     print(f"Distinct system prompt combinations: {len(grouped)}")
     print()
 
 
-def print_prompt_details(grouped: Dict[str, List[Dict[str, Any]]]):
+def print_prompt_details(grouped: Dict[str, Dict[str, Any]], limit: Optional[int] = None):
     """
     Print detailed information about each distinct prompt combination.
+
+    Combinations are shown most frequent first; with a limit only the top
+    `limit` are selected (heapq.nlargest) instead of sorting every group.
     """
-    for idx, (prompt_hash, entries) in enumerate(sorted(grouped.items(), key=lambda x: -len(x[1])), 1):
+    if limit is None:
+        ranked = sorted(grouped.items(), key=lambda x: -x[1]['count'])
+    else:
+        ranked = heapq.nlargest(limit, grouped.items(), key=lambda x: x[1]['count'])
+
+    for idx, (prompt_hash, group) in enumerate(ranked, 1):
+        entries = group['entries']
         print(f"\n{'=' * 80}")
         print(f"COMBINATION #{idx} (Hash: {prompt_hash[:8]}...)")
         print(f"{'=' * 80}")
-        print(f"Occurrences: {len(entries)}")
+        print(f"Occurrences: {group['count']}")
         print(f"Number of prompts in combination: {entries[0]['num_prompts']}")
-        print(f"Models used: {', '.join(set(e['model'] for e in entries))}")
+        print(f"Models used: {', '.join(group['models'])}")
         print()
         
         # Show the actual prompts
@@ -122,26 +145,52 @@ def print_prompt_details(grouped: Dict[str, List[Dict[str, Any]]]):
         print(f"Last occurrence: {entries[-1]['timestamp']} (line {entries[-1]['line_num']})")
 
 
-def save_full_prompts(grouped: Dict[str, List[Dict[str, Any]]], output_file: str):
+def line_ranges(line_nums: List[int]) -> List[List[int]]:
+    """
+    Run-length encode ascending line numbers as [first, last] inclusive ranges.
+
+    Claude Code sends the same system prompts in bursts, so consecutive
+    lines collapse into a single range.
+    """
+    ranges = []
+    for line_num in line_nums:
+        if ranges and line_num == ranges[-1][1] + 1:
+            ranges[-1][1] = line_num
+        else:
+            ranges.append([line_num, line_num])
+    return ranges
+
+
+def save_full_prompts(grouped: Dict[str, Dict[str, Any]], output_file: str):
     """
     Save full prompts to a JSON file for detailed analysis.
+
+    Line numbers are stored as [first, last] ranges (see line_ranges) rather
+    than one entry per occurrence.
     """
     output_data = []
     
-    for prompt_hash, entries in grouped.items():
+    for prompt_hash, group in grouped.items():
+        entries = group['entries']
         output_data.append({
             'hash': prompt_hash,
-            'occurrences': len(entries),
+            'occurrences': group['count'],
             'num_prompts': entries[0]['num_prompts'],
-            'models': list(set(e['model'] for e in entries)),
+            'models': list(group['models']),
             'system_prompts': entries[0]['system'],
             'first_occurrence': entries[0]['timestamp'],
             'last_occurrence': entries[-1]['timestamp'],
-            'line_numbers': [e['line_num'] for e in entries]
+            'first_line': entries[0]['line_num'],
+            'last_line': entries[-1]['line_num'],
+            'line_ranges': line_ranges([e['line_num'] for e in entries])
         })
     
-    with open(output_file, 'w') as f:
-        json.dump(output_data, f, indent=2)
+    if orjson is not None:
+        with open(output_file, 'wb') as f:
+            f.write(orjson.dumps(output_data, option=orjson.OPT_INDENT_2))
+    else:
+        with open(output_file, 'w') as f:
+            json.dump(output_data, f, indent=2)
     
     print(f"\n\nFull prompts saved to: {output_file}")
 
@@ -1,7 +1,14 @@
 import json
 
-with open('proxy/logs/entities_20260110.json', 'r') as f:
-    data = json.load(f)
+try:
+    import orjson
+except ImportError:  # optional speedup, falls back to stdlib json
+    orjson = None
+
+_json_loads = orjson.loads if orjson is not None else json.loads
+
+with open('proxy/logs/entities_20260110.json', 'rb') as f:
+    data = _json_loads(f.read())
 
 spawn_edges = [e for e in data['workflow_dag']['edges'] if e['type'] == 'subagent_spawn']
 
@@ -35,10 +42,10 @@ if agent_20_edge:
     print(f'  {"✓ MATCH!" if edge.get("source_request_id") == 45 else "✗ MISMATCH"}')
 
 # Check all edges have source_request_id
-edges_with_request_id = [e for e in spawn_edges if e.get('source_request_id') is not None]
-print(f'\nEdges with source_request_id: {len(edges_with_request_id)} / {len(spawn_edges)}')
-if len(edges_with_request_id) == len(spawn_edges):
+edges_with_request_id = sum(1 for e in spawn_edges if e.get('source_request_id') is not None)
+print(f'\nEdges with source_request_id: {edges_with_request_id} / {len(spawn_edges)}')
+if edges_with_request_id == len(spawn_edges):
     print('✓ ALL spawn edges have source_request_id!')
 else:
-    print(f'✗ {len(spawn_edges) - len(edges_with_request_id)} edges missing source_request_id')
+    print(f'✗ {len(spawn_edges) - edges_with_request_id} edges missing source_request_id')
 
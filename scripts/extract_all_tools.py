@@ -13,20 +13,54 @@ Usage:
     python3 extract_all_tools.py --full    # Full detailed output
 """
 
+import functools
 import json
 import hashlib
+import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
 from pathlib import Path
 from collections import defaultdict
 from typing import Dict, List, Any, Set, Tuple
 
+try:
+    import orjson
+except ImportError:  # optional speedup, falls back to stdlib json
+    orjson = None
 
-def compute_hash(text: str, length: int = 200) -> str:
-    """Compute SHA256 hash of first N characters."""
+_json_loads = orjson.loads if orjson is not None else json.loads
+
+# Raw JSON keys/values an entry needs for parse_all_logs to use it
+_ENTRY_MARKERS = (b'"system"', b'"tools"', b'"tool_use"')
+
+
+def collapse_whitespace_prefix(text: str, length: int) -> str:
+    """
+    Return ' '.join(text.split())[:length], splitting only a prefix of text.
+
+    Collapsing a prefix yields a prefix of the fully collapsed text, so the
+    slice only grows when whitespace runs leave it short of length chars.
+    """
+    span = length * 2
+    while True:
+        normalized = ' '.join(text[:span].split())
+        if len(normalized) >= length or span >= len(text):
+            return normalized[:length]
+        span *= 2
+
+
+def _compute_hash_raw(text: str, length: int = 200) -> str:
+    """Compute a BLAKE2b hash of the first N characters (grouping key only, not cryptographic)."""
     if not text:
         return ""
-    normalized = ' '.join(text.split())[:length]
-    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+    normalized = collapse_whitespace_prefix(text, length)
+    return hashlib.blake2b(normalized.encode('utf-8'), digest_size=16).hexdigest()
+
+
+# Claude Code resends the same system prompt and tool descriptions with every
+# request, so repeated hashes are served from an LRU cache keyed by (text, length).
+compute_hash = functools.lru_cache(maxsize=4096)(_compute_hash_raw)
 
 
 def extract_system_prompt(log_entry: Dict[str, Any]) -> tuple[str, str]:
@@ -36,12 +70,7 @@ def extract_system_prompt(log_entry: Dict[str, Any]) -> tuple[str, str]:
         return "", ""
 
     # Concatenate all system prompt texts
-    texts = []
-    for prompt in system:
-        if isinstance(prompt, dict):
-            text = prompt.get('text', '')
-            if text:
-                texts.append(text)
+    texts = [text for prompt in system if isinstance(prompt, dict) and (text := prompt.get('text', ''))]
 
     combined = '|||'.join(texts)
     return combined, compute_hash(combined, length=500)
@@ -84,80 +113,177 @@ def extract_tool_uses(log_entry: Dict[str, Any]) -> List[Dict[str, Any]]:
     return tool_uses
 
 
+def _process_log_file(log_file: Path) -> Dict[str, Any]:
+    """
+    Extract tool information from one log file.
+
+    Runs in a worker process when there are several files. Definitions are
+    returned as (variation_key, definition) pairs, first occurrence in this
+    file only, so parse_all_logs can dedupe across files in file order. IDs
+    and tool names are kept in dicts (insertion-ordered) rather than sets so
+    the merged sets are built in the same order as a serial run.
+    """
+    tool_definitions = defaultdict(list)  # tool_name -> list of (variation_key, definition)
+    tool_variations = defaultdict(set)  # tool_name -> set of "desc_hash:system_hash"
+    tool_use_ids = defaultdict(dict)  # tool_name -> tool_use IDs, in first-seen order
+    tool_inputs = defaultdict(list)  # tool_name -> list of sample inputs
+    filled_inputs = set()  # tool names that already have 5 sample inputs
+    system_prompt_contexts = defaultdict(dict)  # system_hash -> tool names, in first-seen order
+    system_prompts = {}  # system_hash -> actual prompt text
+
+    with open(log_file, 'rb') as f:
+        # The file is read once front to back; ask for aggressive readahead
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+        for line_num, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+
+            # Only entries carrying a system prompt, tool definitions or
+            # tool_use blocks contribute; skip the rest without parsing
+            if not any(marker in line for marker in _ENTRY_MARKERS):
+                continue
+
+            try:
+                log_entry = _json_loads(line)
+            except json.JSONDecodeError:
+                continue
+
+            # Fused version of extract_system_prompt, extract_tool_definitions
+            # and extract_tool_uses: each part of the entry is looked up once
+            body = log_entry.get('body') or {}
+
+            # Extract system prompt text and hash
+            system_text, system_hash = "", ""
+            system = body.get('system', [])
+            if system:
+                system_text = '|||'.join([
+                    text for prompt in system
+                    if isinstance(prompt, dict) and (text := prompt.get('text', ''))
+                ])
+                system_hash = compute_hash(system_text, length=500)
+            if system_hash and system_hash not in system_prompts:
+                system_prompts[system_hash] = system_text
+
+            # Extract tool definitions from request
+            for tool in body.get('tools', []):
+                if not isinstance(tool, dict):
+                    continue
+                tool_name = tool.get('name', 'Unknown')
+                description = tool.get('description', '')
+                desc_hash = compute_hash(description, length=300)
+
+                # Track variation (combination of description + system prompt).
+                # The separator keeps an empty hash on either side unambiguous.
+                variation_key = f"{desc_hash}:{system_hash}"
+
+                # set.add is idempotent; a size change means the variation is new
+                variations = tool_variations[tool_name]
+                seen_count = len(variations)
+                variations.add(variation_key)
+                if len(variations) > seen_count:
+                    tool_definitions[tool_name].append((variation_key, {
+                        'description': description,
+                        'input_schema': tool.get('input_schema', {}),
+                        'description_hash': desc_hash,
+                        'system_prompt_hash': system_hash,
+                        'first_seen_file': log_file.name,
+                        'first_seen_line': line_num
+                    }))
+
+                # Track which tools appear with which system prompts
+                if system_hash:
+                    system_prompt_contexts[system_hash][tool_name] = None
+
+            # Extract tool uses from response
+            content = (log_entry.get('response') or {}).get('body', {}).get('content', [])
+            if not isinstance(content, list):
+                continue
+            for block in content:
+                if not isinstance(block, dict) or block.get('type') != 'tool_use':
+                    continue
+                tool_name = block.get('name', '')
+                tool_id = block.get('id', '')
+
+                if tool_id:
+                    tool_use_ids[tool_name][tool_id] = None
+
+                # Store sample inputs (limit to 5 per tool)
+                if tool_name not in filled_inputs:
+                    sample_inputs = tool_inputs[tool_name]
+                    sample_inputs.append(block.get('input', {}))
+                    if len(sample_inputs) >= 5:
+                        filled_inputs.add(tool_name)
+
+    return {
+        'tool_definitions': tool_definitions,
+        'tool_use_ids': tool_use_ids,
+        'tool_inputs': tool_inputs,
+        'system_prompt_contexts': system_prompt_contexts,
+        'system_prompts': system_prompts
+    }
+
+
 def parse_all_logs(log_dir: Path) -> Dict[str, Any]:
     """
     Parse all log files and extract comprehensive tool information.
-    
+
+    Files are parsed in parallel worker processes and merged in sorted file
+    order, so first-seen definitions and sample inputs match a serial run.
+
     Returns:
         Dictionary with tool definitions, variations, and usage statistics
     """
     # Storage for tool information
     tool_definitions = defaultdict(list)  # tool_name -> list of unique definitions
-    tool_variations = defaultdict(set)  # tool_name -> set of (desc_hash, system_hash)
+    tool_variations = defaultdict(set)  # tool_name -> set of "desc_hash:system_hash"
     tool_use_ids = defaultdict(set)  # tool_name -> set of tool_use IDs
     tool_inputs = defaultdict(list)  # tool_name -> list of sample inputs
     system_prompt_contexts = defaultdict(set)  # system_hash -> set of tool names
     system_prompts = {}  # system_hash -> actual prompt text
 
-    # Get all log files
-    log_files = sorted(log_dir.glob("*.jsonl"))
+    # Get all log files (one directory listing, names only, no stat calls)
+    with os.scandir(log_dir) as entries:
+        log_files = sorted(Path(entry.path) for entry in entries if entry.name.endswith('.jsonl'))
 
     print(f"Found {len(log_files)} log files")
 
-    for log_file in log_files:
-        print(f"Processing {log_file.name}...")
-
-        with open(log_file, 'r') as f:
-            for line_num, line in enumerate(f, 1):
-                if not line.strip():
-                    continue
-
-                try:
-                    log_entry = json.loads(line)
-                except json.JSONDecodeError:
-                    continue
-
-                # Extract system prompt text and hash
-                system_text, system_hash = extract_system_prompt(log_entry)
-                if system_hash and system_hash not in system_prompts:
-                    system_prompts[system_hash] = system_text
-
-                # Extract tool definitions from request
-                tool_defs = extract_tool_definitions(log_entry)
-                for tool_def in tool_defs:
-                    tool_name = tool_def['name']
-                    desc_hash = tool_def['description_hash']
-
-                    # Track variation (combination of description + system prompt)
-                    variation_key = (desc_hash, system_hash)
-
-                    if variation_key not in tool_variations[tool_name]:
-                        tool_variations[tool_name].add(variation_key)
-                        tool_definitions[tool_name].append({
-                            'description': tool_def['description'],
-                            'input_schema': tool_def['input_schema'],
-                            'description_hash': desc_hash,
-                            'system_prompt_hash': system_hash,
-                            'first_seen_file': log_file.name,
-                            'first_seen_line': line_num
-                        })
-
-                    # Track which tools appear with which system prompts
-                    if system_hash:
-                        system_prompt_contexts[system_hash].add(tool_name)
-
-                # Extract tool uses from response
-                tool_uses = extract_tool_uses(log_entry)
-                for tool_use in tool_uses:
-                    tool_name = tool_use['name']
-                    tool_id = tool_use['id']
-
-                    if tool_id:
-                        tool_use_ids[tool_name].add(tool_id)
-
-                    # Store sample inputs (limit to 5 per tool)
-                    if len(tool_inputs[tool_name]) < 5:
-                        tool_inputs[tool_name].append(tool_use['input'])
+    workers = min(len(log_files), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers) if workers > 1 else nullcontext() as executor:
+        partials = executor.map(_process_log_file, log_files) if executor else map(_process_log_file, log_files)
+
+        for log_file, partial in zip(log_files, partials):
+            print(f"Processing {log_file.name}...")
+
+            for system_hash, system_text in partial['system_prompts'].items():
+                system_prompts.setdefault(system_hash, system_text)
+
+            for tool_name, definitions in partial['tool_definitions'].items():
+                # set.add is idempotent; a size change means the variation is new
+                variations = tool_variations[tool_name]
+                for variation_key, definition in definitions:
+                    seen_count = len(variations)
+                    variations.add(variation_key)
+                    if len(variations) > seen_count:
+                        tool_definitions[tool_name].append(definition)
+
+            # Add one at a time: set.update() presizes the table, which would
+            # change the set's iteration order (and so the output lists)
+            for system_hash, tool_names in partial['system_prompt_contexts'].items():
+                context = system_prompt_contexts[system_hash]
+                for tool_name in tool_names:
+                    context.add(tool_name)
+
+            for tool_name, ids in partial['tool_use_ids'].items():
+                use_ids = tool_use_ids[tool_name]
+                for tool_id in ids:
+                    use_ids.add(tool_id)
+
+            # Store sample inputs (limit to 5 per tool)
+            for tool_name, inputs in partial['tool_inputs'].items():
+                sample_inputs = tool_inputs[tool_name]
+                sample_inputs.extend(inputs[:5 - len(sample_inputs)])
 
     return {
         'tool_definitions': dict(tool_definitions),
@@ -181,6 +307,7 @@ def format_tool_output(data: Dict[str, Any], simplified: bool = True) -> Dict[st
         Dictionary with summary stats and tool information
     """
     tools = []
+    system_prompts = data['system_prompts']
 
     for tool_name in sorted(data['tool_definitions'].keys()):
         definitions = data['tool_definitions'][tool_name]
@@ -203,36 +330,34 @@ def format_tool_output(data: Dict[str, Any], simplified: bool = True) -> Dict[st
 
         # Add each variation
         for idx, definition in enumerate(definitions, 1):
-            if simplified:
-                # Get system prompt text
-                sys_hash = definition['system_prompt_hash']
-                sys_text = data['system_prompts'].get(sys_hash, '')
+            # Get system prompt text
+            sys_hash = definition['system_prompt_hash']
+            sys_text = system_prompts.get(sys_hash, '')
 
+            if simplified:
                 variation = {
                     'variation_id': idx,
                     'description': definition['description'],
                     'system_prompt': sys_text,
                 }
             else:
-                sample_inputs = data['tool_inputs'].get(tool_name, [])
-                sys_hash = definition['system_prompt_hash']
-                sys_text = data['system_prompts'].get(sys_hash, '')
-
                 variation = {
                     'variation_id': idx,
                     'description': definition['description'],
                     'input_schema': definition['input_schema'],
                     'description_hash': definition['description_hash'],
                     'system_prompt': sys_text,
-                    'system_prompt_hash': definition['system_prompt_hash'],
+                    'system_prompt_hash': sys_hash,
                     'first_seen': {
                         'file': definition['first_seen_file'],
                         'line': definition['first_seen_line']
                     }
                 }
                 # Add sample input for first variation only
-                if idx == 1 and sample_inputs:
-                    variation['sample_inputs'] = sample_inputs
+                if idx == 1:
+                    sample_inputs = data['tool_inputs'].get(tool_name, [])
+                    if sample_inputs:
+                        variation['sample_inputs'] = sample_inputs
 
             tool_entry['variations'].append(variation)
 
@@ -20,10 +20,13 @@ def parse_tools_from_log(log_file_path: str, target_time: str = "01:30:54"):
         List of dictionaries containing tool name and description
     """
     tools_info = []
+    # The timestamp is plain ASCII in the raw line, so lines without the
+    # target time can be skipped without parsing them
+    target_bytes = target_time.encode()
     
-    with open(log_file_path, 'r') as f:
+    with open(log_file_path, 'rb') as f:
         for line in f:
-            if not line.strip():
+            if target_bytes not in line:
                 continue
                 
             try:
@@ -2,17 +2,20 @@
 import hashlib
 import re
 
+# Same digest as analysis/agent_tracker.py compute_hash (BLAKE2b sized to length hex chars)
 def compute_hash(text, length=16):
-    return hashlib.sha256(text.encode()).hexdigest()[:length]
+    return hashlib.blake2b(text.encode(), digest_size=length // 2).hexdigest()
+
+_RE_REDIRECT = re.compile(r'\s*(?:2>/dev/null|2>&1)\s*')
+_RE_TAIL_PIPE = re.compile(r'\s*\|[^|]*$')
+_STRIP_QUOTES = str.maketrans('', '', '"\'')
 
 def normalize_command(command):
     if not command:
         return ''
-    normalized = re.sub(r'\s*2>/dev/null\s*', ' ', command)
-    normalized = re.sub(r'\s*2>&1\s*', ' ', normalized)
-    normalized = re.sub(r'\s*\|[^|]*$', '', normalized)
-    normalized = normalized.replace('"', '')
-    normalized = normalized.replace("'", '')
+    normalized = _RE_REDIRECT.sub(' ', command)
+    normalized = _RE_TAIL_PIPE.sub('', normalized)
+    normalized = normalized.translate(_STRIP_QUOTES)
     normalized = ' '.join(normalized.split())
     return normalized.strip()
 
@@ -1,8 +1,15 @@
 #!/usr/bin/env python3
 import json
 
-with open('proxy/logs/entities_extracted.json', 'r') as f:
-    data = json.load(f)
+try:
+    import orjson
+except ImportError:  # optional speedup, falls back to stdlib json
+    orjson = None
+
+_json_loads = orjson.loads if orjson is not None else json.loads
+
+with open('proxy/logs/entities_extracted.json', 'rb') as f:
+    data = _json_loads(f.read())
 
 edges = data.get('workflow_dag', {}).get('edges', [])
 agents = data.get('workflow_dag', {}).get('nodes', [])
@@ -47,11 +54,12 @@ else:
 print()
 
 print("=== SUMMARY ===")
-print(f"Total subagent_spawn edges: {len([e for e in edges if e['type'] == 'subagent_spawn'])}")
-print(f"  - task spawns: {len([e for e in edges if e.get('spawn_method') == 'task'])}")
-print(f"  - tool_call spawns: {len([e for e in edges if e.get('spawn_method') == 'tool_call'])}")
+print(f"Total subagent_spawn edges: {sum(1 for e in edges if e['type'] == 'subagent_spawn')}")
+print(f"  - task spawns: {sum(1 for e in edges if e.get('spawn_method') == 'task')}")
+print(f"  - tool_call spawns: {sum(1 for e in edges if e.get('spawn_method') == 'tool_call')}")
 print()
+child_agents = sum(1 for a in agents if a.get('parent_agent_id'))
 print(f"Total agents: {len(agents)}")
-print(f"  - Root agents: {len([a for a in agents if not a.get('parent_agent_id')])}")
-print(f"  - Child agents: {len([a for a in agents if a.get('parent_agent_id')])}")
+print(f"  - Root agents: {len(agents) - child_agents}")
+print(f"  - Child agents: {child_agents}")
 